@@ -1,9 +1,11 @@
 # -*- mode: python ; coding: utf-8 -*-
-from flask import Flask, request, jsonify, send_from_directory, Response
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response
 from flask_cors import CORS
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo import MongoClient, ASCENDING, ReturnDocument, ReplaceOne
+from pymongo.errors import ConnectionFailure, OperationFailure, BulkWriteError, DuplicateKeyError
 from bson.objectid import ObjectId
+import bson
+from bson import json_util
 from datetime import datetime, timedelta, UTC
 import os
 import sys
@@ -20,10 +22,20 @@ import schedule
 import time
 import threading
 import waitress
+from waitress.channel import HTTPChannel
 import tenacity
 import json
 import secrets
 import hashlib
+import heapq
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import re
+import base64
+import codecs
+import gzip
+import shutil
 from dotenv import load_dotenv
 import bcrypt
 import tempfile
@@ -95,7 +107,8 @@ CORS(app, resources={
     r"/api/*": {
         "origins": "*",
         "methods": ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Accept"]
+        "allow_headers": ["Content-Type", "Accept", "If-None-Match"],
+        "expose_headers": ["ETag"]
     }
 })
 
@@ -115,12 +128,44 @@ def connect_to_mongodb():
         logger.error(f"Failed to connect to MongoDB: {str(e)}")
         raise
 
+# Index registry: (collection, keys, options) for every lookup the routes make.
+# create_index is a no-op when an identical index already exists, so this runs
+# on every boot.
+INDEX_REGISTRY = [
+    ('users', [('email', ASCENDING)], {}),
+    ('users', [('phone_number', ASCENDING)], {}),
+    ('users', [('firstName', ASCENDING)], {}),
+    ('sales', [('invoice_no', ASCENDING)], {}),
+    ('sales', [('date', ASCENDING), ('_id', ASCENDING)], {}),
+    ('sales_daily_summary', [('date', ASCENDING), ('pos_profile', ASCENDING), ('userId', ASCENDING)], {'unique': True}),
+    ('activeorders', [('orderId', ASCENDING), ('cartItems.id', ASCENDING)], {}),
+    ('activeorders', [('cartItems.requiredKitchens', ASCENDING)], {}),
+    ('tripreports', [('deliveryPersonId', ASCENDING)], {}),
+    ('picked_up_items', [('customerName', ASCENDING), ('tableNumber', ASCENDING), ('bucket', ASCENDING), ('seq', ASCENDING)],
+     {'unique': True, 'partialFilterExpression': {'seq': {'$exists': True}}}),
+    ('email_tokens', [('token_hash', ASCENDING)], {'unique': True}),
+    ('email_tokens', [('expires_at', ASCENDING)], {'expireAfterSeconds': 0}),
+    ('order_counters', [('order_type', ASCENDING)], {'unique': True}),
+    ('jobs', [('status', ASCENDING), ('run_after', ASCENDING)], {}),
+    ('jobs', [('finished_at', ASCENDING)], {'expireAfterSeconds': 7 * 24 * 3600}),
+]
+
+def ensure_indexes(database):
+    """Create the indexes in INDEX_REGISTRY. Failures are logged, never fatal."""
+    for collection_name, keys, options in INDEX_REGISTRY:
+        try:
+            name = database[collection_name].create_index(keys, **options)
+            logger.debug(f"Index ready: {collection_name}.{name}")
+        except OperationFailure as e:
+            logger.error(f"Could not create index {keys} on {collection_name}: {str(e)}")
+
 try:
     client = connect_to_mongodb()
     db = client['restaurant']
     items_collection = db['items']
     customers_collection = db['customers']
     sales_collection = db['sales']
+    sales_daily_summary_collection = db['sales_daily_summary']
     tables_collection = db['tables']
     users_collection = db['users']
     picked_up_collection = db['picked_up_items']
@@ -130,19 +175,21 @@ try:
     settings_collection = db['system_settings']
     kitchens_collection = db['kitchens']
     item_groups_collection = db['item_groups']  
-    kitchen_saved_collection = db['kitchen_saved']
     variants_collection = db['variants']
     employees_collection = db['employees']
     activeorders_collection = db['activeorders']
     tripreports_collection = db['tripreports']  # New collection for trip reports
     order_counters_collection = db['order_counters']
     email_settings_collection = db['email_settings']
+    jobs_collection = db['jobs']
+    backup_state_collection = db['backup_state']
     table_orders_collection = db['table_orders']  # New collection for table orders
     purchase_items_collection = db['purchase_items']
     suppliers_collection = db['suppliers']
     purchase_orders_collection = db['purchase_orders']
     purchase_receipts_collection = db['purchase_receipts']
     purchase_invoices_collection = db['purchase_invoices']
+    ensure_indexes(db)
     
     
     
@@ -202,6 +249,8 @@ TEST_USERS = [
         "is_test": True
     }
 ]
+TEST_USER_EMAILS = {u['email'] for u in TEST_USERS}
+TEST_USERS_BY_IDENTIFIER = {u[field]: u for u in TEST_USERS for field in ('firstName', 'phone_number', 'email')}
 
 # Utility functions
 def allowed_file(filename, allowed_extensions):
@@ -217,6 +266,19 @@ def convert_objectid_to_str(item):
                     sub_item['_id'] = str(sub_item['_id'])
     return item
 
+def json_default(value):
+    """json.dumps fallback matching what the routes send: ISO dates, strings otherwise."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def ndjson_response(cursor, batch_size=500):
+    """Stream a pymongo cursor as newline-delimited JSON without buffering it."""
+    def generate():
+        for doc in cursor.batch_size(batch_size):
+            yield json.dumps(convert_objectid_to_str(doc), default=json_default) + '\n'
+    return Response(generate(), mimetype='application/x-ndjson')
+
 def handle_image_upload(file):
     if not file or not allowed_file(file.filename, ALLOWED_IMAGE_EXTENSIONS):
         logger.error(f"Invalid file or type: {file.filename if file else 'No file'}")
@@ -273,7 +335,25 @@ def sanitize_image_fields(data):
     return data
 
 # System settings management
+# Settings are read on every login and many other requests, so the document is
+# cached against the system_settings catalog version, which every settings
+# write bumps. The TTL only guards against edits made outside this process.
+SETTINGS_CACHE_TTL = 30
+settings_cache_lock = threading.Lock()
+settings_cache = {'version': None, 'settings': None, 'loaded_at': 0}
+
 def get_system_settings():
+    version = catalog_versions['system_settings']
+    with settings_cache_lock:
+        if (settings_cache['version'] == version
+                and time.monotonic() - settings_cache['loaded_at'] < SETTINGS_CACHE_TTL):
+            return dict(settings_cache['settings'])
+    settings = load_system_settings()
+    with settings_cache_lock:
+        settings_cache.update(version=version, settings=settings, loaded_at=time.monotonic())
+    return dict(settings)
+
+def load_system_settings():
     settings = settings_collection.find_one({"_id": "system_settings"})
     if not settings:
         default_settings = {
@@ -296,12 +376,202 @@ def get_system_settings():
             "minimumPasswordScore": 2
         }
         settings_collection.insert_one(default_settings)
+        bump_catalog_version('system_settings')
         return default_settings
     return settings
 
 def save_system_settings(settings):
     settings["_id"] = "system_settings"
     settings_collection.replace_one({"_id": "system_settings"}, settings, upsert=True)
+    bump_catalog_version('system_settings')
+
+# Catalog ETags
+# Terminals poll the catalog endpoints constantly. Each catalog collection has a
+# change counter bumped by its write routes; the ETag is derived from it (plus a
+# per-process epoch, since counters restart at zero) so unchanged polls get 304.
+CATALOG_EPOCH = uuid.uuid4().hex[:8]
+catalog_versions_lock = threading.Lock()
+catalog_versions = {'kitchens': 0, 'item_groups': 0, 'variants': 0, 'tables': 0, 'system_settings': 0}
+
+def bump_catalog_version(collection_name):
+    with catalog_versions_lock:
+        catalog_versions[collection_name] += 1
+
+def catalog_etag(collection_name):
+    with catalog_versions_lock:
+        return f"{collection_name}-{CATALOG_EPOCH}-{catalog_versions[collection_name]}"
+
+def not_modified(etag):
+    """Return a 304 response if the client already holds etag, else None."""
+    if etag and request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return None
+
+def with_etag(response, etag):
+    if etag:
+        response.set_etag(etag)
+    return response
+
+# Offer timeline
+OFFER_FIELDS = {'offer_price', 'offer_start_time', 'offer_end_time'}
+
+# Offer windows are parsed once, when an item is written (or on first use), and
+# their start/end instants are kept in a heap. Reads then only check membership
+# in the active set, and boundaries are applied as time passes them.
+offer_timeline_lock = threading.Lock()
+offer_timeline = {
+    'loaded': False,
+    'generation': 0,
+    'windows': {},   # item_id -> (offer_end_time as stored, generation)
+    'heap': [],      # (instant, generation, item_id, 'start' | 'end')
+    'active': set(),
+    'expired': {},   # item_id -> offer_end_time as stored, awaiting $unset
+}
+
+def parse_offer_window(offer_start_time, offer_end_time):
+    """Parse stored offer times into aware datetimes; start is None for end-only offers."""
+    start = datetime.fromisoformat(str(offer_start_time).replace('Z', '+00:00')) if offer_start_time else None
+    end = datetime.fromisoformat(str(offer_end_time).replace('Z', '+00:00'))
+    if end.tzinfo is None or (start is not None and start.tzinfo is None):
+        raise ValueError("offer times must include a timezone offset")
+    if start is not None and start > end:
+        raise ValueError("offer_start_time is after offer_end_time")
+    return start, end
+
+def _set_offer_window(item_id, offer_start_time, offer_end_time, current_time):
+    """Replace the timeline entry for one item. Caller holds offer_timeline_lock."""
+    offer_timeline['windows'].pop(item_id, None)
+    offer_timeline['active'].discard(item_id)
+    offer_timeline['expired'].pop(item_id, None)
+    if not offer_end_time:
+        return
+    try:
+        start, end = parse_offer_window(offer_start_time, offer_end_time)
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Invalid offer time format for item {item_id}: {str(e)}")
+        offer_timeline['expired'][item_id] = offer_end_time
+        return
+    # The offer is active while start <= now <= end, so it ends just after end.
+    ends_at = end + timedelta(microseconds=1)
+    if ends_at <= current_time:
+        offer_timeline['expired'][item_id] = offer_end_time
+        return
+    offer_timeline['generation'] += 1
+    generation = offer_timeline['generation']
+    offer_timeline['windows'][item_id] = (offer_end_time, generation)
+    if start is None or start <= current_time:
+        offer_timeline['active'].add(item_id)
+    else:
+        heapq.heappush(offer_timeline['heap'], (start, generation, item_id, 'start'))
+    heapq.heappush(offer_timeline['heap'], (ends_at, generation, item_id, 'end'))
+
+def _advance_offer_timeline(current_time):
+    """Load the timeline if needed and apply every boundary up to current_time. Caller holds offer_timeline_lock."""
+    if not offer_timeline['loaded']:
+        offer_timeline.update(windows={}, heap=[], active=set(), expired={})
+        for item in items_collection.find({'offer_end_time': {'$exists': True}}, {'offer_start_time': 1, 'offer_end_time': 1}):
+            _set_offer_window(str(item['_id']), item.get('offer_start_time'), item.get('offer_end_time'), current_time)
+        offer_timeline['loaded'] = True
+        logger.info(f"Offer timeline loaded: {len(offer_timeline['windows'])} scheduled offers")
+    heap = offer_timeline['heap']
+    while heap and heap[0][0] <= current_time:
+        _, generation, item_id, event = heapq.heappop(heap)
+        window = offer_timeline['windows'].get(item_id)
+        if not window or window[1] != generation:
+            continue
+        if event == 'start':
+            offer_timeline['active'].add(item_id)
+        else:
+            offer_timeline['active'].discard(item_id)
+            offer_timeline['windows'].pop(item_id)
+            offer_timeline['expired'][item_id] = window[0]
+    # Drop entries left behind by replaced windows so heap[0] is the real next boundary.
+    while heap and offer_timeline['windows'].get(heap[0][2], (None, None))[1] != heap[0][1]:
+        heapq.heappop(heap)
+
+def get_offer_state(current_time):
+    """Return the ids of items with an active offer and the next instant that changes it."""
+    with offer_timeline_lock:
+        _advance_offer_timeline(current_time)
+        heap = offer_timeline['heap']
+        return frozenset(offer_timeline['active']), (heap[0][0] if heap else None)
+
+def update_offer_timeline(item_id, offer_start_time=None, offer_end_time=None):
+    """Record an item's offer window after it has been written to MongoDB."""
+    with offer_timeline_lock:
+        if offer_timeline['loaded']:
+            _set_offer_window(str(item_id), offer_start_time, offer_end_time, datetime.now(UTC))
+
+def refresh_offer_timeline(object_id):
+    """Re-read an item's offer fields after a partial update touched them."""
+    if not offer_timeline['loaded']:
+        return
+    item = items_collection.find_one({'_id': object_id}, {'offer_start_time': 1, 'offer_end_time': 1}) or {}
+    update_offer_timeline(object_id, item.get('offer_start_time'), item.get('offer_end_time'))
+
+def reset_offer_timeline():
+    """Force a reload from MongoDB on next use, e.g. after a bulk import."""
+    with offer_timeline_lock:
+        offer_timeline['loaded'] = False
+
+def strip_inactive_offer(item, active_offers):
+    if item['_id'] not in active_offers:
+        item.pop('offer_price', None)
+        item.pop('offer_start_time', None)
+        item.pop('offer_end_time', None)
+    return item
+
+# Menu snapshot cache
+# GET /api/items is polled by every terminal, so the serialized menu is kept in
+# memory. Item writes bump the version; the snapshot also expires at the next
+# offer start/end so offer prices appear and disappear on time.
+menu_snapshot_lock = threading.Lock()
+menu_snapshot = {'version': 0, 'built_version': None, 'items': None, 'valid_until': None, 'builds': 0, 'etag': None}
+
+def invalidate_menu_snapshot():
+    """Mark the cached menu as stale after any write to items_collection."""
+    with menu_snapshot_lock:
+        menu_snapshot['version'] += 1
+
+def build_menu_snapshot(current_time):
+    """Serialize all items for GET /api/items and return the next offer boundary."""
+    active_offers, valid_until = get_offer_state(current_time)
+    items_list = []
+    for item in items_collection.find():
+        item = strip_inactive_offer(convert_objectid_to_str(item), active_offers)
+        if 'image' in item and item['image']:
+            item['image'] = f"/static/uploads/{item['image']}"
+        for addon in item.get("addons", []):
+            if 'addon_image' in addon and addon['addon_image']:
+                addon['addon_image'] = f"/static/uploads/{addon['addon_image']}"
+        for combo in item.get("combos", []):
+            if 'combo_image' in combo and combo['combo_image']:
+                combo['combo_image'] = f"/static/uploads/{combo['combo_image']}"
+        for variant in item.get("variants", []):
+            if 'variant_image' in variant and variant['variant_image']:
+                variant['variant_image'] = f"/static/uploads/{variant['variant_image']}"
+        items_list.append(item)
+    return items_list, valid_until
+
+def get_menu_snapshot():
+    """Return (items, etag) for the cached menu, rebuilding it if stale or past an offer boundary."""
+    current_time = datetime.now(UTC)
+    with menu_snapshot_lock:
+        version = menu_snapshot['version']
+        if menu_snapshot['built_version'] == version and (
+                menu_snapshot['valid_until'] is None or current_time < menu_snapshot['valid_until']):
+            return menu_snapshot['items'], menu_snapshot['etag']
+    items_list, valid_until = build_menu_snapshot(current_time)
+    with menu_snapshot_lock:
+        # A write that landed while we were building wins; the next request rebuilds.
+        if menu_snapshot['version'] == version:
+            menu_snapshot['builds'] += 1
+            etag = f"items-{CATALOG_EPOCH}-{menu_snapshot['builds']}"
+            menu_snapshot.update(built_version=version, items=items_list, valid_until=valid_until, etag=etag)
+            return items_list, etag
+    return items_list, None
 
 # API Routes
 @app.route('/api/test', methods=['GET'])
@@ -309,6 +579,178 @@ def test_route():
     logger.info("Test route accessed")
     return jsonify({"message": "API is working"}), 200
 
+# Bulk import
+IMPORT_BATCH_SIZE = 1000
+IMPORT_READ_SIZE = 64 * 1024
+IMPORT_MAX_REPORTED_ERRORS = 100
+JSON_NUMBER_CHARS = frozenset('0123456789.eE+-')
+
+def iter_json_array(stream, read_size=IMPORT_READ_SIZE):
+    """Yield the elements of a top-level JSON array read incrementally from a binary stream."""
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer, pos, eof = '', 0, False
+
+    def read_more():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(read_size)
+        eof = not chunk
+        buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+
+    state = 'start'
+    while True:
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            read_more()
+        if pos >= len(buffer):
+            raise json.JSONDecodeError("Unexpected end of file", buffer, pos)
+        char = buffer[pos]
+        if state == 'start':
+            if char != '[':
+                raise ValueError("JSON data must be an array")
+            pos += 1
+            state = 'first'
+        elif state == 'separator':
+            if char == ']':
+                return
+            if char != ',':
+                raise json.JSONDecodeError("Expected ',' or ']'", buffer, pos)
+            pos += 1
+            state = 'value'
+        else:
+            if state == 'first' and char == ']':
+                return
+            # A number cut at the buffer edge still decodes ("-2" of "-2.5"),
+            # so only accept a value once the next character cannot continue
+            # a number, or at EOF.
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    if eof or (end < len(buffer) and buffer[end] not in JSON_NUMBER_CHARS):
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                read_more()
+            pos = end
+            state = 'separator'
+            yield value
+
+# Each importable collection declares its natural key (used for the upsert when
+# a record has no _id) and the fields it requires and type-checks.
+IMPORT_REGISTRY = {
+    'users': {'key': 'email', 'types': {'email': 'string', 'firstName': 'string'}},
+    'tables': {'key': 'table_number'},
+    'items': {'key': 'item_name', 'types': {'item_name': 'string', 'price_list_rate': 'number'}},
+    'customers': {'key': 'phone_number'},
+    'sales': {'key': 'invoice_no', 'types': {'items': 'array'}},
+    'picked_up_items': {'key': 'customerName'},
+    'pos_opening_entries': {'key': 'name'},
+    'pos_closing_entries': {'key': 'name'},
+    'kitchens': {'key': 'kitchen_name', 'types': {'kitchen_name': 'string'}},
+    'item_groups': {'key': 'group_name', 'types': {'group_name': 'string'}},
+    'activeorders': {'key': 'orderId', 'types': {'orderId': 'string', 'cartItems': 'array'}},
+    'employees': {'key': 'employeeId', 'required': ('email',), 'types': {'email': 'string'}},
+    'variants': {'key': 'heading', 'types': {'heading': 'string', 'subheadings': 'array'}},
+    'purchase_items': {'key': 'name', 'types': {'conversionFactor': 'number'}},
+    'suppliers': {'key': 'email', 'types': {'email': 'string'}},
+    'purchase_orders': {'key': 'id', 'types': {'items': 'array'}},
+    'purchase_receipts': {'key': 'id', 'types': {'items': 'array'}},
+    'purchase_invoices': {'key': 'id', 'types': {'items': 'array'}},
+    'tripreports': {'key': 'tripId', 'types': {'cartItems': 'array'}},
+}
+
+IMPORT_FIELD_TYPES = {
+    'string': (lambda value: isinstance(value, str), 'a string'),
+    'number': (lambda value: isinstance(value, (int, float)) and not isinstance(value, bool), 'a number'),
+    'array': (lambda value: isinstance(value, list), 'an array'),
+    'object': (lambda value: isinstance(value, dict), 'an object'),
+}
+
+def compile_import_validator(spec):
+    """Build a record validator for one registry entry. Returns a function giving a list of problems."""
+    key = spec['key']
+    required = tuple(spec.get('required', ()))
+    checks = tuple((field,) + IMPORT_FIELD_TYPES[kind] for field, kind in spec.get('types', {}).items())
+
+    def validate(record):
+        problems = []
+        if '_id' not in record and record.get(key) is None:
+            problems.append(f"missing {key}")
+        for field in required:
+            if record.get(field) is None:
+                problems.append(f"missing {field}")
+        for field, check, label in checks:
+            value = record.get(field)
+            if value is not None and not check(value):
+                problems.append(f"{field} must be {label}")
+        return problems
+    return validate
+
+IMPORT_VALIDATORS = {name: compile_import_validator(spec) for name, spec in IMPORT_REGISTRY.items()}
+
+def import_unique_key(collection_name, record):
+    """The filter an imported record replaces: its _id, else the collection's natural key."""
+    if '_id' in record:
+        return {'_id': record['_id']}
+    key = IMPORT_REGISTRY[collection_name]['key']
+    return {key: record[key]}
+
+def bulk_upsert(collection, operations, positions):
+    """Run one unordered batch. Returns (inserted, updated, [(record index, error)])."""
+    try:
+        details = collection.bulk_write(operations, ordered=False).bulk_api_result
+        errors = []
+    except BulkWriteError as e:
+        details = e.details
+        errors = [(positions[error['index']], error['errmsg']) for error in details['writeErrors']]
+    return details['nUpserted'], details['nMatched'], errors
+
+def classify_import_batch(collection, natural_key, batch, seen_keys):
+    """Split a batch into writable records and conflicts, without writing.
+
+    batch holds (index, unique_key, record); seen_keys carries the keys of earlier
+    batches so a key repeated in the file is reported. A conflict is a key that
+    repeats in the file, matches several documents, or an _id whose natural key
+    belongs to another document; replacing any of those would overwrite an
+    arbitrary document. Both the dry run and the real import use this, so they
+    agree. Returns ([(index, unique_key, record, exists)], [(record index, conflict)]).
+    """
+    lookups = {}
+    for _, unique_key, record in batch:
+        (field, value), = unique_key.items()
+        lookups.setdefault(field, []).append(value)
+        if field == '_id' and record.get(natural_key) is not None:
+            lookups.setdefault(natural_key, []).append(record[natural_key])
+    existing = {}
+    for field, values in lookups.items():
+        for doc in collection.find({field: {'$in': values}}, {field: 1}):
+            existing.setdefault((field, repr(doc.get(field))), []).append(doc['_id'])
+
+    ready, conflicts = [], []
+    for index, unique_key, record in batch:
+        (field, value), = unique_key.items()
+        token = (field, repr(value))
+        matches = existing.get(token, [])
+        if token in seen_keys:
+            conflicts.append((index, f"{field} {value} repeats record {seen_keys[token]}"))
+            continue
+        seen_keys[token] = index
+        if len(matches) > 1:
+            conflicts.append((index, f"{field} {value} matches {len(matches)} existing documents"))
+            continue
+        if field == '_id' and record.get(natural_key) is not None:
+            owners = existing.get((natural_key, repr(record[natural_key])), [])
+            if any(owner != value for owner in owners):
+                conflicts.append((index, f"{natural_key} {record[natural_key]} belongs to another document"))
+                continue
+        ready.append((index, unique_key, record, bool(matches)))
+    return ready, conflicts
+
 @app.route('/api/import-mongodb', methods=['POST', 'OPTIONS'])
 def import_mongodb():
     logger.info(f"Request received: {request.method} {request.path}")
@@ -343,64 +785,113 @@ def import_mongodb():
         # Example: restaurant.item_groups.json -> item_groups
         collection_name = filename.rsplit('.', 1)[0].split('.')[-1]
         
-        # Define valid collections
-        valid_collections = [
-            'users', 'tables', 'items', 'customers', 'sales',
-            'picked_up_items', 'pos_opening_entries', 'pos_closing_entries',
-            'kitchens', 'item_groups'  # Added item_groups
-        ]
-        
         # Validate collection name
-        if not collection_name or collection_name not in valid_collections:
+        if not collection_name or collection_name not in IMPORT_REGISTRY:
             logger.error(f"Invalid or unsupported collection name: {collection_name}")
             return jsonify({"error": f"Unsupported collection name: {collection_name}"}), 400
 
         target_collection = db[collection_name]
-        
-        # Read and parse JSON file
-        data = json.loads(file.read().decode('utf-8'))
-        if not isinstance(data, list):
-            logger.error("JSON data must be an array")
-            return jsonify({"error": "JSON data must be an array"}), 400
-
-        inserted_count = 0
-        for record in data:
-            # Handle MongoDB ObjectId
-            if '_id' in record and isinstance(record['_id'], dict) and '$oid' in record['_id']:
-                record['_id'] = ObjectId(record['_id']['$oid'])
-            
-            # Add import timestamp
-            record['imported_at'] = datetime.now(UTC).isoformat()
-
-            # Define unique key for upsert based on collection
-            unique_key = (
-                {'_id': record.get('_id')} if '_id' in record else
-                {'email': record.get('email')} if collection_name == 'users' else
-                {'table_number': record.get('table_number')} if collection_name == 'tables' else
-                {'item_name': record.get('item_name')} if collection_name == 'items' else
-                {'phone_number': record.get('phone_number')} if collection_name == 'customers' else
-                {'invoice_no': record.get('invoice_no')} if collection_name == 'sales' else
-                {'customerName': record.get('customerName')} if collection_name == 'picked_up_items' else
-                {'name': record.get('name')} if collection_name in ['pos_opening_entries', 'pos_closing_entries'] else
-                {'kitchen_name': record.get('kitchen_name')} if collection_name == 'kitchens' else
-                {'group_name': record.get('group_name')} if collection_name == 'item_groups' else
-                {}
-            )
-
-            if not unique_key:
-                logger.error(f"No unique key defined for record in collection {collection_name}")
-                return jsonify({"error": f"No unique key defined for record in collection {collection_name}"}), 400
-
-            # Perform upsert
-            target_collection.replace_one(unique_key, record, upsert=True)
-            inserted_count += 1
+        validate = IMPORT_VALIDATORS[collection_name]
+        natural_key = IMPORT_REGISTRY[collection_name]['key']
+        dry_run = (request.args.get('dry_run') or request.form.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+
+        # Records are parsed and written in batches; nothing holds the whole file
+        started = time.monotonic()
+        imported_at = datetime.now(UTC).isoformat()
+        batch, errors, conflicts = [], [], []
+        seen_keys = {}
+        received = inserted = updated = failed = conflicted = 0
+
+        def record_error(index, message):
+            nonlocal failed
+            failed += 1
+            if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                errors.append({"index": index, "error": message})
+
+        def flush():
+            nonlocal inserted, updated, conflicted
+            ready, batch_conflicts = classify_import_batch(target_collection, natural_key, batch, seen_keys)
+            conflicted += len(batch_conflicts)
+            conflicts.extend({"index": index, "conflict": message}
+                             for index, message in batch_conflicts[:IMPORT_MAX_REPORTED_ERRORS - len(conflicts)])
+            if dry_run:
+                batch_updated = sum(1 for _, _, _, exists in ready if exists)
+                batch_inserted = len(ready) - batch_updated
+            elif ready:
+                # Conflicting records are skipped, never written
+                operations = [ReplaceOne(unique_key, record, upsert=True) for _, unique_key, record, _ in ready]
+                batch_inserted, batch_updated, batch_errors = bulk_upsert(
+                    target_collection, operations, [index for index, _, _, _ in ready])
+                for index, message in batch_errors:
+                    record_error(index, message)
+            else:
+                batch_inserted = batch_updated = 0
+            inserted += batch_inserted
+            updated += batch_updated
+            batch.clear()
 
-        logger.info(f"Imported {inserted_count} records into {collection_name}")
-        return jsonify({"message": f"Successfully imported {inserted_count} records into {collection_name}"}), 200
+        try:
+            for index, record in enumerate(iter_json_array(file.stream)):
+                received += 1
+                if not isinstance(record, dict):
+                    record_error(index, "Record must be a JSON object")
+                    continue
+                # Handle MongoDB ObjectId
+                if '_id' in record and isinstance(record['_id'], dict) and '$oid' in record['_id']:
+                    try:
+                        record['_id'] = ObjectId(record['_id']['$oid'])
+                    except Exception as e:
+                        record_error(index, f"Invalid ObjectId: {str(e)}")
+                        continue
+                problems = validate(record)
+                if problems:
+                    record_error(index, "; ".join(problems))
+                    continue
+                record['imported_at'] = imported_at
+                batch.append((index, import_unique_key(collection_name, record), record))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    flush()
+            if batch:
+                flush()
+        finally:
+            if not dry_run and (inserted or updated):
+                if collection_name == 'items':
+                    reset_offer_timeline()
+                    invalidate_menu_snapshot()
+                elif collection_name in catalog_versions:
+                    bump_catalog_version(collection_name)
+                elif collection_name == 'sales':
+                    logger.info("Sales imported; POST /api/sales-summary/rebuild to refresh the daily summaries")
+
+        elapsed = time.monotonic() - started
+        stats = {
+            "collection": collection_name,
+            "received": received,
+            "failed": failed,
+            "errors": errors,
+            "seconds": round(elapsed, 3),
+            "records_per_second": round(received / elapsed) if elapsed else received
+        }
+        if dry_run:
+            logger.info(f"Dry-run import into {collection_name}: {inserted} inserts, {updated} updates, {conflicted} conflicts, {failed} invalid")
+            return jsonify(dict(stats,
+                message=f"Dry run: {inserted} inserts, {updated} updates, {conflicted} conflicts and {failed} invalid records for {collection_name}",
+                dry_run=True, inserts=inserted, updates=updated, conflicted=conflicted, conflicts=conflicts)), 200
+
+        imported = inserted + updated
+        logger.info(f"Imported {imported} of {received} records into {collection_name} in {elapsed:.2f}s ({failed} failed, {conflicted} conflicts skipped)")
+        message = f"Successfully imported {imported} records into {collection_name}"
+        if failed or conflicted:
+            message = f"Imported {imported} of {received} records into {collection_name}; {failed} failed, {conflicted} skipped as conflicts"
+        return jsonify(dict(stats, message=message, imported=imported, inserted=inserted, updated=updated,
+                            conflicted=conflicted, conflicts=conflicts)), 200
 
     except json.JSONDecodeError as e:
         logger.error(f"Invalid JSON format in file {filename}: {str(e)}")
-        return jsonify({"error": f"Invalid JSON format: {str(e)}"}), 400
+        return jsonify({"error": f"Invalid JSON format: {str(e)}", "imported": 0 if dry_run else inserted + updated}), 400
+    except ValueError as e:
+        logger.error(f"Invalid import file {filename}: {str(e)}")
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logger.error(f"Error importing data: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -516,6 +1007,7 @@ def delete_image(filename):
             if result.modified_count == 0:
                 logger.warning(f"Image {filename} not found in variants for item {item_id}")
                 return jsonify({"error": "Image not found in variants"}), 404
+        invalidate_menu_snapshot()
         if os.path.exists(file_path):
             try:
                 os.remove(file_path)
@@ -534,6 +1026,84 @@ def delete_image(filename):
         logger.error(f"Error deleting image {filename} for item {item_id}: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Password hashing
+# bcrypt is deliberately slow, so hashes run on a small dedicated pool instead
+# of the request threads. Callers wait at most PASSWORD_HASH_TIMEOUT, and once
+# the workers and queue are full new sign-ins are refused straight away rather
+# than piling up in front of order traffic.
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv('PASSWORD_HASH_QUEUE_LIMIT', 16))
+PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 5))
+
+password_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix='bcrypt')
+password_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT)
+password_hash_stats_lock = threading.Lock()
+password_hash_stats = {'completed': 0, 'rejected': 0, 'timed_out': 0, 'in_flight': 0, 'samples': deque(maxlen=500)}
+
+class PasswordHashBusy(Exception):
+    """Raised when the hashing pool is saturated or a hash did not finish in time."""
+
+def run_password_hash(func, *args):
+    """Run func(*args) on the hashing pool and wait for its result."""
+    if not password_hash_slots.acquire(blocking=False):
+        with password_hash_stats_lock:
+            password_hash_stats['rejected'] += 1
+        raise PasswordHashBusy("Too many sign-ins in progress, please retry")
+    submitted = time.monotonic()
+    with password_hash_stats_lock:
+        password_hash_stats['in_flight'] += 1
+
+    def timed():
+        started = time.monotonic()
+        try:
+            return func(*args)
+        finally:
+            finished = time.monotonic()
+            with password_hash_stats_lock:
+                password_hash_stats['completed'] += 1
+                password_hash_stats['in_flight'] -= 1
+                password_hash_stats['samples'].append((started - submitted, finished - started))
+            password_hash_slots.release()
+
+    future = password_hash_executor.submit(timed)
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except FutureTimeoutError:
+        with password_hash_stats_lock:
+            password_hash_stats['timed_out'] += 1
+        raise PasswordHashBusy("Password check timed out, please retry")
+
+def hash_password(password):
+    return run_password_hash(
+        lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8'))
+
+def check_password(password, hashed):
+    return run_password_hash(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+def password_hash_metrics():
+    """Counters plus queue-wait and hash-time percentiles (ms) over the last 500 hashes."""
+    with password_hash_stats_lock:
+        stats = {key: value for key, value in password_hash_stats.items() if key != 'samples'}
+        samples = list(password_hash_stats['samples'])
+
+    def percentiles(values):
+        if not values:
+            return None
+        values = sorted(values)
+        pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 1)
+        return {'p50': pick(0.5), 'p95': pick(0.95), 'max': round(values[-1] * 1000, 1)}
+
+    stats.update({
+        'workers': PASSWORD_HASH_WORKERS,
+        'queue_limit': PASSWORD_HASH_QUEUE_LIMIT,
+        'timeout_seconds': PASSWORD_HASH_TIMEOUT,
+        'bcrypt_rounds': BCRYPT_ROUNDS,
+        'queue_wait_ms': percentiles([wait for wait, _ in samples]),
+        'hash_ms': percentiles([duration for _, duration in samples])
+    })
+    return stats
+
 @app.route('/api/login', methods=['POST'])
 def login():
     try:
@@ -545,22 +1115,25 @@ def login():
         if not identifier or not password:
             return jsonify({"message": "Identifier and password are required"}), 400
 
-        user = None
         mobileOnly = settings.get('allowLoginUsingMobileNumber', False) and not settings.get('allowLoginUsingUserName', False) and not settings.get('loginWithEmailLink', False)
         mobileOrUsername = settings.get('allowLoginUsingMobileNumber', False) and settings.get('allowLoginUsingUserName', False) and not settings.get('loginWithEmailLink', False)
         allThree = settings.get('allowLoginUsingMobileNumber', False) and settings.get('allowLoginUsingUserName', False) and settings.get('loginWithEmailLink', False)
 
         if mobileOnly:
-            user = users_collection.find_one({"phone_number": identifier})
+            login_fields = ['phone_number']
         elif mobileOrUsername or login_type == 'mobile_or_username':
-            user = users_collection.find_one({"phone_number": identifier}) or users_collection.find_one({"firstName": identifier})
+            login_fields = ['phone_number', 'firstName']
         elif allThree or login_type == 'all':
-            user = users_collection.find_one({"phone_number": identifier}) or users_collection.find_one({"firstName": identifier}) or users_collection.find_one({"email": identifier})
+            login_fields = ['phone_number', 'firstName', 'email']
         else:
             return jsonify({"message": "No valid login method enabled"}), 403
 
+        # One indexed $or lookup; a phone match wins over a name match, which wins over email
+        candidates = list(users_collection.find({'$or': [{field: identifier} for field in login_fields]}))
+        user = next((u for field in login_fields for u in candidates if u.get(field) == identifier), None)
+
         requires_opening_entry = False
-        if user and bcrypt.checkpw(password.encode('utf-8'), user['password'].encode('utf-8')):
+        if user and check_password(password, user['password']):
             last_opening_time = user.get('last_opening_entry_time')
             if last_opening_time:
                 try:
@@ -591,13 +1164,13 @@ def login():
             return jsonify(response), 200
 
         # Check for test user
-        test_user = next((u for u in TEST_USERS if ((u['firstName'] == identifier or u['phone_number'] == identifier or u['email'] == identifier) and u['password'] == password)), None)
-        if test_user:
+        test_user = TEST_USERS_BY_IDENTIFIER.get(identifier)
+        if test_user and test_user['password'] == password:
             # Check if test user already exists in the database
             existing_user = users_collection.find_one({"email": test_user['email']})
             if not existing_user:
                 # Hash the test user's password and insert into the database
-                hashed_password = bcrypt.hashpw(test_user['password'].encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+                hashed_password = hash_password(test_user['password'])
                 new_user = {
                     "email": test_user['email'],
                     "password": hashed_password,
@@ -635,6 +1208,9 @@ def login():
 
         logger.warning(f"Invalid login attempt: {identifier}")
         return jsonify({"message": "Invalid credentials"}), 401
+    except PasswordHashBusy as e:
+        logger.warning(f"Login deferred for {data.get('identifier')}: {str(e)}")
+        return jsonify({"message": str(e)}), 503
     except Exception as e:
         logger.error(f"Login failed: {str(e)}")
         return jsonify({"message": f"Login failed: {str(e)}"}), 500
@@ -659,6 +1235,7 @@ def request_email_login():
             "email": email,
             "token_hash": token_hash,
             "expiry": expiry.isoformat(),
+            "expires_at": expiry,
             "used": False,
             "created_at": datetime.now(ZoneInfo("UTC")).isoformat()
         })
@@ -669,17 +1246,9 @@ def request_email_login():
         <a href="{login_link}">Login Now</a>
         <p>This link expires in 24 hours.</p>
         """
-        msg = MIMEMultipart('alternative')
-        msg['From'] = FROM_EMAIL
-        msg['To'] = email
-        msg['Subject'] = "Your Login Link"
-        msg.attach(MIMEText(html_content, 'html'))
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:
-            server.starttls()
-            server.login(EMAIL_USER, EMAIL_PASS)
-            server.send_message(msg)
-        logger.info(f"Email login link sent to: {email}")
-        return jsonify({"message": "Login link sent to your email"}), 200
+        job_id = enqueue_job('send_email', {'to': email, 'subject': "Your Login Link", 'html': html_content})
+        logger.info(f"Email login link queued for: {email}")
+        return jsonify({"message": "Login link sent to your email", "job_id": job_id}), 200
     except Exception as e:
         logger.error(f"Error sending email login link: {str(e)}")
         return jsonify({"message": f"Failed: {str(e)}"}), 500
@@ -733,7 +1302,7 @@ def register():
         if not email or not password or not role or not firstName or not phone_number:
             logger.error("Missing required fields in registration")
             return jsonify({"message": "Email, password, role, firstName, and phoneNumber are required"}), 400
-        if email in [u['email'] for u in TEST_USERS]:
+        if email in TEST_USER_EMAILS:
             logger.warning(f"Registration attempt with test email: {email}")
             return jsonify({"message": "Cannot register with test credentials"}), 400
         if users_collection.find_one({"email": email}):
@@ -742,7 +1311,7 @@ def register():
         if users_collection.find_one({"phone_number": phone_number}):
             logger.warning(f"Registration attempt with existing phone number: {phone_number}")
             return jsonify({"message": "Phone number already registered"}), 400
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = hash_password(password)
         new_user = {
             "email": email,
             "password": hashed_password,
@@ -767,6 +1336,9 @@ def register():
                 "company": company
             }
         }), 201
+    except PasswordHashBusy as e:
+        logger.warning(f"Registration deferred: {str(e)}")
+        return jsonify({"message": str(e)}), 503
     except Exception as e:
         logger.error(f"Registration failed: {str(e)}")
         return jsonify({"message": f"Registration failed: {str(e)}"}), 500
@@ -785,7 +1357,7 @@ def get_users():
 @app.route('/api/users/<email>', methods=['DELETE'])
 def delete_user(email):
     try:
-        if email in [u['email'] for u in TEST_USERS]:
+        if email in TEST_USER_EMAILS:
             logger.warning(f"Attempt to delete test user: {email}")
             return jsonify({"message": "Cannot delete test users"}), 400
         result = users_collection.delete_one({"email": email})
@@ -802,9 +1374,13 @@ def delete_user(email):
 @app.route('/api/settings', methods=['GET'])
 def get_settings():
     try:
+        etag = catalog_etag('system_settings')
+        response = not_modified(etag)
+        if response:
+            return response
         settings = get_system_settings()
         logger.info("Fetched system settings")
-        return jsonify(settings), 200
+        return with_etag(jsonify(settings), etag), 200
     except Exception as e:
         logger.error(f"Error fetching settings: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -813,6 +1389,12 @@ def get_settings():
 def update_settings():
     try:
         data = request.get_json()
+        if not isinstance(data, dict):
+            return jsonify({"error": "Settings must be a JSON object"}), 400
+        if (data.get('orderNumberReset') or 'never') not in ORDER_NUMBER_RESET_POLICIES:
+            return jsonify({"error": f"orderNumberReset must be one of: {', '.join(ORDER_NUMBER_RESET_POLICIES)}"}), 400
+        if 'orderNumberResetTime' in data and parse_reset_time(data['orderNumberResetTime']) is None:
+            return jsonify({"error": "orderNumberResetTime must be HH:MM (24-hour)"}), 400
         save_system_settings(data)
         logger.info("System settings updated")
         return jsonify({"message": "Settings updated successfully"}), 200
@@ -820,68 +1402,40 @@ def update_settings():
         logger.error(f"Error updating settings: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/admin/indexes', methods=['GET'])
+def get_index_report():
+    """Report every index on the registered collections with its usage since server start."""
+    try:
+        declared = {(name, tuple(keys)) for name, keys, _ in INDEX_REGISTRY}
+        report = {}
+        for collection_name in sorted({name for name, _, _ in INDEX_REGISTRY}):
+            entries = []
+            for stat in db[collection_name].aggregate([{'$indexStats': {}}]):
+                keys = tuple(stat['key'].items())
+                since = stat.get('accesses', {}).get('since')
+                entries.append({
+                    'name': stat['name'],
+                    'key': stat['key'],
+                    'ops': stat.get('accesses', {}).get('ops', 0),
+                    'since': since.isoformat() if since else None,
+                    'declared': (collection_name, keys) in declared
+                })
+            report[collection_name] = sorted(entries, key=lambda entry: entry['name'])
+        logger.info("Fetched index usage report")
+        return jsonify(report), 200
+    except Exception as e:
+        logger.error(f"Error fetching index report: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/items', methods=['GET'])
 def get_items():
     try:
-        items = list(items_collection.find())
-        items_list = []
-        current_time = datetime.now(UTC)
-        for item in items:
-            item = convert_objectid_to_str(item)
-            is_offer_active = False
-            if 'offer_start_time' in item and item['offer_start_time'] and 'offer_end_time' in item and item['offer_end_time']:
-                try:
-                    offer_start_time = datetime.fromisoformat(str(item['offer_start_time']).replace('Z', '+00:00'))
-                    offer_end_time = datetime.fromisoformat(str(item['offer_end_time']).replace('Z', '+00:00'))
-                    if offer_start_time <= current_time <= offer_end_time:
-                        is_offer_active = True
-                        logger.debug(f"Offer active for item {item['_id']}: {offer_start_time} to {offer_end_time}")
-                    else:
-                        logger.debug(f"Offer inactive for item {item['_id']}: {offer_start_time} to {offer_end_time}")
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"Invalid offer time format for item {item['_id']}: {str(e)}")
-                    items_collection.update_one(
-                        {'_id': ObjectId(item['_id'])},
-                        {'$unset': {'offer_price': "", 'offer_start_time': "", 'offer_end_time': ""}}
-                    )
-                    item.pop('offer_price', None)
-                    item.pop('offer_start_time', None)
-                    item.pop('offer_end_time', None)
-            elif 'offer_end_time' in item and item['offer_end_time']:
-                try:
-                    offer_end_time = datetime.fromisoformat(str(item['offer_end_time']).replace('Z', '+00:00'))
-                    if current_time <= offer_end_time:
-                        is_offer_active = True
-                        logger.debug(f"Offer active for item {item['_id']}: ends at {offer_end_time}")
-                    else:
-                        logger.debug(f"Offer expired for item {item['_id']}: ended at {offer_end_time}")
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"Invalid offer_end_time format for item {item['_id']}: {str(e)}")
-                    items_collection.update_one(
-                        {'_id': ObjectId(item['_id'])},
-                        {'$unset': {'offer_price': "", 'offer_start_time': "", 'offer_end_time': ""}}
-                    )
-                    item.pop('offer_price', None)
-                    item.pop('offer_start_time', None)
-                    item.pop('offer_end_time', None)
-            if not is_offer_active:
-                item.pop('offer_price', None)
-                item.pop('offer_start_time', None)
-                item.pop('offer_end_time', None)
-            if 'image' in item and item['image']:
-                item['image'] = f"/static/uploads/{item['image']}"
-            for addon in item.get("addons", []):
-                if 'addon_image' in addon and addon['addon_image']:
-                    addon['addon_image'] = f"/static/uploads/{addon['addon_image']}"
-            for combo in item.get("combos", []):
-                if 'combo_image' in combo and combo['combo_image']:
-                    combo['combo_image'] = f"/static/uploads/{combo['combo_image']}"
-            for variant in item.get("variants", []):
-                if 'variant_image' in variant and variant['variant_image']:
-                    variant['variant_image'] = f"/static/uploads/{variant['variant_image']}"
-            items_list.append(item)
+        items_list, etag = get_menu_snapshot()
+        response = not_modified(etag)
+        if response:
+            return response
         logger.info(f"Fetched {len(items_list)} items")
-        return jsonify(items_list), 200
+        return with_etag(jsonify(items_list), etag), 200
     except Exception as e:
         logger.error(f"Error fetching items: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -898,48 +1452,8 @@ def get_item(identifier):
         if not item:
             logger.warning(f"Item not found: {identifier}")
             return jsonify({"error": "Item not found"}), 404
-        item = convert_objectid_to_str(item)
-        current_time = datetime.now(UTC)
-        is_offer_active = False
-        if 'offer_start_time' in item and item['offer_start_time'] and 'offer_end_time' in item and item['offer_end_time']:
-            try:
-                offer_start_time = datetime.fromisoformat(str(item['offer_start_time']).replace('Z', '+00:00'))
-                offer_end_time = datetime.fromisoformat(str(item['offer_end_time']).replace('Z', '+00:00'))
-                if offer_start_time <= current_time <= offer_end_time:
-                    is_offer_active = True
-                    logger.debug(f"Offer active for item {item['_id']}: {offer_start_time} to {offer_end_time}")
-                else:
-                    logger.debug(f"Offer inactive for item {item['_id']}: {offer_start_time} to {offer_end_time}")
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Invalid offer time format for item {item['_id']}: {str(e)}")
-                items_collection.update_one(
-                    {'_id': ObjectId(item['_id'])},
-                    {'$unset': {'offer_price': "", 'offer_start_time': "", 'offer_end_time': ""}}
-                )
-                item.pop('offer_price', None)
-                item.pop('offer_start_time', None)
-                item.pop('offer_end_time', None)
-        elif 'offer_end_time' in item and item['offer_end_time']:
-            try:
-                offer_end_time = datetime.fromisoformat(str(item['offer_end_time']).replace('Z', '+00:00'))
-                if current_time <= offer_end_time:
-                    is_offer_active = True
-                    logger.debug(f"Offer active for item {item['_id']}: ends at {offer_end_time}")
-                else:
-                    logger.debug(f"Offer expired for item {item['_id']}: ended at {offer_end_time}")
-            except (ValueError, TypeError) as e:
-                logger.warning(f"Invalid offer_end_time for item {item['_id']}: {str(e)}")
-                items_collection.update_one(
-                    {'_id': ObjectId(item['_id'])},
-                    {'$unset': {'offer_price': "", 'offer_start_time': "", 'offer_end_time': ""}}
-                )
-                item.pop('offer_price', None)
-                item.pop('offer_start_time', None)
-                item.pop('offer_end_time', None)
-        if not is_offer_active:
-            item.pop('offer_price', None)
-            item.pop('offer_start_time', None)
-            item.pop('offer_end_time', None)
+        active_offers, _ = get_offer_state(datetime.now(UTC))
+        item = strip_inactive_offer(convert_objectid_to_str(item), active_offers)
         if 'image' in item and item['image']:
             item['image'] = f"/static/uploads/{item['image']}"
         for addon in item.get('addons', []):
@@ -995,6 +1509,8 @@ def create_item():
         data.setdefault('custom_variants', [])  # Added for custom variants
         data['created_at'] = datetime.now(UTC).isoformat()
         item_id = items_collection.insert_one(data).inserted_id
+        update_offer_timeline(item_id, data.get('offer_start_time'), data.get('offer_end_time'))
+        invalidate_menu_snapshot()
         logger.info(f"Item created with ID: {item_id}")
         return jsonify({'message': 'Item created successfully!', 'id': str(item_id)}), 201
     except Exception as e:
@@ -1031,6 +1547,9 @@ def update_item(item_id):
         if result.matched_count == 0:
             logger.warning(f"Item not found for update: {item_id}")
             return jsonify({"error": "Item not found"}), 404
+        if OFFER_FIELDS & item_data.keys():
+            refresh_offer_timeline(object_id)
+        invalidate_menu_snapshot()
         logger.info(f"Item updated: {item_id}")
         return jsonify({"message": "Item updated successfully"}), 200
     except Exception as e:
@@ -1057,6 +1576,9 @@ def patch_item(item_id):
         if result.matched_count == 0:
             logger.warning(f"Item not found for patch: {item_id}")
             return jsonify({"error": "Item not found"}), 404
+        if OFFER_FIELDS & item_data.keys():
+            refresh_offer_timeline(object_id)
+        invalidate_menu_snapshot()
         logger.info(f"Item patched: {item_id}")
         return jsonify({"message": "Item updated successfully"}), 200
     except Exception as e:
@@ -1075,6 +1597,8 @@ def delete_item(item_id):
         if result.deleted_count == 0:
             logger.warning(f"Item not found for deletion: {item_id}")
             return jsonify({"error": "Item not found"}), 404
+        update_offer_timeline(object_id)
+        invalidate_menu_snapshot()
         logger.info(f"Item deleted: {item_id}")
         return jsonify({"message": "Item deleted successfully"}), 200
     except Exception as e:
@@ -1106,6 +1630,8 @@ def update_item_offer(item_id):
         if result.matched_count == 0:
             logger.warning(f"Item not found for offer update: {item_id}")
             return jsonify({"error": "Item not found"}), 404
+        update_offer_timeline(object_id, offer_data['offer_start_time'], offer_data['offer_end_time'])
+        invalidate_menu_snapshot()
         logger.info(f"Offer updated for item: {item_id}, start: {offer_start_time}, end: {offer_end_time}")
         return jsonify({"message": "Offer updated successfully"}), 200
     except Exception as e:
@@ -1115,6 +1641,9 @@ def update_item_offer(item_id):
 @app.route('/api/customers', methods=['GET'])
 def get_all_customers():
     try:
+        if request.args.get('format') == 'ndjson':
+            logger.info("Streaming customers as NDJSON")
+            return ndjson_response(customers_collection.find())
         customers = list(customers_collection.find())
         customers = [convert_objectid_to_str(customer) for customer in customers]
         logger.info(f"Fetched {len(customers)} customers")
@@ -1197,6 +1726,55 @@ def create_customer():
         logger.error(f"Error creating customer: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Daily sales summary
+# One document per (date, pos_profile, userId), kept current with $inc as
+# invoices are created or change status, so reports read a few small documents
+# instead of re-aggregating the sales collection.
+def summary_field(name):
+    """Make a payment mode, item name or status safe to use as a field name."""
+    return str(name).replace('.', '_').replace('$', '_') or 'Unknown'
+
+def sales_summary_key(sale):
+    return {
+        'date': sale.get('date'),
+        'pos_profile': sale.get('pos_profile', 'POS-001'),
+        'userId': sale.get('userId')
+    }
+
+def sales_summary_increments(sale):
+    """Return the $inc document that adds one invoice to its daily summary."""
+    grand_total = float(sale.get('grand_total') or 0)
+    status = summary_field(sale.get('status', 'Draft'))
+    inc = {
+        'invoice_count': 1,
+        'net_total': float(sale.get('total') or 0),
+        'vat_amount': float(sale.get('vat_amount') or 0),
+        'grand_total': grand_total,
+        'total_quantity': 0,
+        f'status_counts.{status}': 1,
+        f'status_totals.{status}': grand_total
+    }
+    for item in sale.get('items', []):
+        quantity = int(item.get('quantity') or 0)
+        inc['total_quantity'] += quantity
+        field = f"items.{summary_field(item.get('item_name', 'Unknown'))}"
+        inc[field] = inc.get(field, 0) + quantity
+    for payment in sale.get('payments') or []:
+        field = f"payments.{summary_field(str(payment.get('mode_of_payment', 'Unknown')).upper())}"
+        inc[field] = inc.get(field, 0) + float(payment.get('amount') or 0)
+    return inc
+
+def record_sale_in_summary(sale):
+    """Add a saved invoice to its daily summary. Failures are logged; /api/sales-summary/rebuild repairs them."""
+    try:
+        sales_daily_summary_collection.update_one(
+            sales_summary_key(sale),
+            {'$inc': sales_summary_increments(sale), '$set': {'modified_at': datetime.now(UTC).isoformat()}},
+            upsert=True
+        )
+    except Exception as e:
+        logger.error(f"Error updating daily sales summary for {sale.get('invoice_no')}: {str(e)}")
+
 @app.route('/api/sales', methods=['POST'])
 def create_sales_invoice():
     try:
@@ -1228,6 +1806,7 @@ def create_sales_invoice():
         # Ensure invoice_no is present
         sales_data['invoice_no'] = sales_data.get('invoice_no', f"INV-{int(datetime.now().timestamp())}")
         sales_data['status'] = sales_data.get('status', 'Draft')
+        sales_data['pos_profile'] = sales_data.get('pos_profile', user.get('pos_profile', 'POS-001'))
         
         # Process items
         processed_items = []
@@ -1280,6 +1859,7 @@ def create_sales_invoice():
         
         # Insert into database
         sales_id = sales_collection.insert_one(sales_data).inserted_id
+        record_sale_in_summary(sales_data)
         logger.info(f"Sale saved successfully: {sales_data['invoice_no']} by user {sales_data['userId']}")
         
         return jsonify({
@@ -1294,13 +1874,95 @@ def create_sales_invoice():
         logger.error(f"Error creating sales invoice: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# Fields returned by the paginated sales list unless ?fields= asks for others.
+SALES_LIST_FIELDS = [
+    'invoice_no', 'date', 'time', 'customer', 'userId', 'status', 'orderType',
+    'total', 'vat_amount', 'grand_total', 'payments'
+]
+SALES_PAGE_DEFAULT = 50
+SALES_PAGE_MAX = 500
+
+def build_sales_query(args):
+    """Translate GET /api/sales filters (fromDate, toDate, status, userId, paymentMode) into a query."""
+    query = {}
+    date_range = {}
+    if args.get('fromDate'):
+        date_range['$gte'] = args['fromDate']
+    if args.get('toDate'):
+        date_range['$lte'] = args['toDate']
+    if date_range:
+        query['date'] = date_range
+    if args.get('status'):
+        query['status'] = args['status']
+    if args.get('userId'):
+        query['userId'] = args['userId']
+    if args.get('paymentMode'):
+        # Terminals store CASH/Card/UPI inconsistently, so match case-insensitively.
+        query['payments.mode_of_payment'] = {'$regex': f"^{re.escape(args['paymentMode'])}$", '$options': 'i'}
+    return query
+
+def encode_sales_cursor(sale):
+    raw = f"{sale.get('date', '')}|{sale['_id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_sales_cursor(cursor):
+    date, object_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').rsplit('|', 1)
+    return date, ObjectId(object_id)
+
 @app.route('/api/sales', methods=['GET'])
 def get_all_sales():
+    """List sales invoices.
+
+    Without ?limit or ?cursor the full filtered list is returned as an array, as
+    before; ?format=ndjson streams it instead. With them, results are
+    keyset-paginated newest first on (date, _id) and returned as
+    {"sales": [...], "next_cursor": ...} using SALES_LIST_FIELDS.
+    """
     try:
-        sales = list(sales_collection.find())
-        sales = [convert_objectid_to_str(sale) for sale in sales]
-        logger.info(f"Fetched {len(sales)} sales invoices")
-        return jsonify(sales), 200
+        query = build_sales_query(request.args)
+        if request.args.get('format') == 'ndjson':
+            logger.info("Streaming sales invoices as NDJSON")
+            return ndjson_response(sales_collection.find(query).sort([('date', 1), ('_id', 1)]))
+        if 'limit' not in request.args and 'cursor' not in request.args:
+            sales = list(sales_collection.find(query))
+            sales = [convert_objectid_to_str(sale) for sale in sales]
+            logger.info(f"Fetched {len(sales)} sales invoices")
+            return jsonify(sales), 200
+
+        try:
+            limit = min(int(request.args.get('limit', SALES_PAGE_DEFAULT)), SALES_PAGE_MAX)
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        if limit < 1:
+            return jsonify({"error": "limit must be positive"}), 400
+        if request.args.get('cursor'):
+            try:
+                cursor_date, cursor_id = decode_sales_cursor(request.args['cursor'])
+            except Exception:
+                return jsonify({"error": "Invalid cursor"}), 400
+            after_cursor = {'$or': [
+                {'date': {'$lt': cursor_date}},
+                {'date': cursor_date, '_id': {'$lt': cursor_id}}
+            ]}
+            query = {'$and': [query, after_cursor]} if query else after_cursor
+
+        fields = request.args.get('fields')
+        if fields == 'all':
+            projection = None
+        else:
+            projection = {field: 1 for field in (fields.split(',') if fields else SALES_LIST_FIELDS)}
+            projection['date'] = 1
+
+        # Fetch one extra document to know whether another page exists.
+        sales = list(
+            sales_collection.find(query, projection)
+            .sort([('date', -1), ('_id', -1)])
+            .limit(limit + 1)
+        )
+        next_cursor = encode_sales_cursor(sales[limit - 1]) if len(sales) > limit else None
+        sales = [convert_objectid_to_str(sale) for sale in sales[:limit]]
+        logger.info(f"Fetched page of {len(sales)} sales invoices")
+        return jsonify({"sales": sales, "next_cursor": next_cursor}), 200
     except Exception as e:
         logger.error(f"Error fetching sales: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -1326,26 +1988,160 @@ def update_sale_status(invoice_no):
         status = data.get('status')
         if not status:
             return jsonify({"error": "Status is required"}), 400
-        result = sales_collection.update_one(
+        previous = sales_collection.find_one_and_update(
             {'invoice_no': invoice_no.strip()},
-            {'$set': {'status': status, 'modified_at': datetime.now(UTC).isoformat()}}
+            {'$set': {'status': status, 'modified_at': datetime.now(UTC).isoformat()}},
+            projection={'date': 1, 'pos_profile': 1, 'userId': 1, 'status': 1, 'grand_total': 1},
+            return_document=ReturnDocument.BEFORE
         )
-        if result.matched_count == 0:
+        if previous is None:
             logger.warning(f"Sale not found for status update: {invoice_no}")
             return jsonify({"error": "Invoice not found"}), 404
+        old_status = summary_field(previous.get('status', 'Draft'))
+        new_status = summary_field(status)
+        if old_status != new_status:
+            grand_total = float(previous.get('grand_total') or 0)
+            sales_daily_summary_collection.update_one(
+                sales_summary_key(previous),
+                {'$inc': {
+                    f'status_counts.{old_status}': -1,
+                    f'status_counts.{new_status}': 1,
+                    f'status_totals.{old_status}': -grand_total,
+                    f'status_totals.{new_status}': grand_total
+                }, '$set': {'modified_at': datetime.now(UTC).isoformat()}}
+            )
         logger.info(f"Sale status updated: {invoice_no} to {status}")
         return jsonify({"message": "Sale status updated successfully"}), 200
     except Exception as e:
         logger.error(f"Error updating sale status {invoice_no}: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/sales-summary', methods=['GET'])
+def get_sales_summary():
+    """Fetch daily sales summaries filtered by fromDate, toDate, pos_profile and userId."""
+    try:
+        query = {}
+        date_range = {}
+        if request.args.get('fromDate'):
+            date_range['$gte'] = request.args['fromDate']
+        if request.args.get('toDate'):
+            date_range['$lte'] = request.args['toDate']
+        if date_range:
+            query['date'] = date_range
+        for field in ['pos_profile', 'userId']:
+            if request.args.get(field):
+                query[field] = request.args[field]
+        summaries = list(sales_daily_summary_collection.find(query, {'_id': 0}).sort('date', 1))
+        logger.info(f"Fetched {len(summaries)} daily sales summaries")
+        return jsonify(summaries), 200
+    except Exception as e:
+        logger.error(f"Error fetching sales summary: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+SALES_SUMMARY_REBUILD_ATTEMPTS = 3
+
+def summarize_sales(sales):
+    """Fold sales into daily summaries keyed by (date, pos_profile, userId)."""
+    summaries = {}
+    for sale in sales:
+        key = sales_summary_key(sale)
+        summary = summaries.setdefault((key['date'], key['pos_profile'], key['userId']), dict(key))
+        for field, amount in sales_summary_increments(sale).items():
+            target = summary
+            *parents, leaf = field.split('.')
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[leaf] = target.get(leaf, 0) + amount
+    return summaries
+
+def sales_for_summary_query(key):
+    """The sales that sales_summary_key maps to key."""
+    date, pos_profile, user_id = key
+    query = {'date': date, 'userId': user_id, 'pos_profile': pos_profile}
+    if pos_profile == 'POS-001':
+        del query['pos_profile']
+        query['$or'] = [{'pos_profile': 'POS-001'}, {'pos_profile': {'$exists': False}}]
+    return query
+
+def summary_versions(keys=None):
+    """modified_at of each existing summary row, keyed like summarize_sales."""
+    query = {}
+    if keys is not None:
+        query = {'$or': [{'date': date, 'pos_profile': pos_profile, 'userId': user_id} for date, pos_profile, user_id in keys]}
+    return {
+        (row.get('date'), row.get('pos_profile'), row.get('userId')): row.get('modified_at')
+        for row in sales_daily_summary_collection.find(query, {'date': 1, 'pos_profile': 1, 'userId': 1, 'modified_at': 1})
+    }
+
+def write_rebuilt_summaries(keys, summaries, versions):
+    """Replace each summary row only if it is unchanged since versions was read.
+
+    A row a live sale touched in the meantime no longer matches its filter, so the
+    upsert collides with the unique (date, pos_profile, userId) index instead of
+    overwriting that sale. Returns the keys that collided.
+    """
+    now = datetime.now(UTC).isoformat()
+    conflicts, operations, positions = set(), [], []
+    for key in keys:
+        date, pos_profile, user_id = key
+        current = {'date': date, 'pos_profile': pos_profile, 'userId': user_id, 'modified_at': versions.get(key)}
+        if key in summaries:
+            operations.append(ReplaceOne(current, dict(summaries[key], modified_at=now), upsert=True))
+            positions.append(key)
+        elif key in versions and sales_daily_summary_collection.delete_one(current).deleted_count == 0:
+            conflicts.add(key)
+    if operations:
+        try:
+            sales_daily_summary_collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details['writeErrors']:
+                if error['code'] != 11000:
+                    raise
+                conflicts.add(positions[error['index']])
+    return conflicts
+
+@app.route('/api/sales-summary/rebuild', methods=['POST'])
+def rebuild_sales_summary():
+    """Recompute every daily summary from the sales collection (for data that predates it).
+
+    Rows are replaced in place, never dropped wholesale, so sales recorded during
+    the rebuild keep counting: a row they touch is recomputed from its own sales
+    and written again, up to SALES_SUMMARY_REBUILD_ATTEMPTS times.
+    """
+    try:
+        versions = summary_versions()
+        summaries = summarize_sales(sales_collection.find().batch_size(500))
+        pending = set(summaries) | set(versions)
+        total = len(summaries)
+        for attempt in range(SALES_SUMMARY_REBUILD_ATTEMPTS):
+            pending = write_rebuilt_summaries(pending, summaries, versions)
+            if not pending:
+                break
+            logger.info(f"Recomputing {len(pending)} daily sales summaries changed during the rebuild")
+            versions = summary_versions(pending)
+            summaries = {}
+            for key in pending:
+                summaries.update(summarize_sales(sales_collection.find(sales_for_summary_query(key))))
+        if pending:
+            logger.warning(f"{len(pending)} daily sales summaries kept changing during the rebuild")
+            return jsonify({"error": f"{len(pending)} daily summaries changed during the rebuild; run it again"}), 409
+        logger.info(f"Rebuilt {total} daily sales summaries")
+        return jsonify({"message": f"Rebuilt {total} daily sales summaries"}), 200
+    except Exception as e:
+        logger.error(f"Error rebuilding sales summary: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/tables', methods=['GET'])
 def get_tables():
     try:
+        etag = catalog_etag('tables')
+        response = not_modified(etag)
+        if response:
+            return response
         tables = list(tables_collection.find())
         tables = [convert_objectid_to_str(table) for table in tables]
         logger.info(f"Fetched {len(tables)} tables")
-        return jsonify({"message": tables}), 200
+        return with_etag(jsonify({"message": tables}), etag), 200
     except Exception as e:
         logger.error(f"Error fetching tables: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -1368,6 +2164,7 @@ def add_table():
             "created_at": datetime.now(UTC).isoformat()
         }
         tables_collection.insert_one(new_table)
+        bump_catalog_version('tables')
         logger.info(f"Table added: {table_number}")
         return jsonify({"message": "Table added successfully"}), 201
     except Exception as e:
@@ -1388,6 +2185,7 @@ def update_table(table_number):
         if result.matched_count == 0:
             logger.warning(f"Table not found for update: {table_number}")
             return jsonify({"error": "Table not found"}), 404
+        bump_catalog_version('tables')
         logger.info(f"Table updated: {table_number}")
         return jsonify({"message": "Table updated successfully"}), 200
     except Exception as e:
@@ -1401,6 +2199,7 @@ def delete_table(table_number):
         if result.deleted_count == 0:
             logger.warning(f"Table not found: {table_number}")
             return jsonify({"error": "Table not found"}), 404
+        bump_catalog_version('tables')
         logger.info(f"Table deleted: {table_number}")
         return jsonify({"message": "Table deleted successfully"}), 200
     except Exception as e:
@@ -1483,18 +2282,41 @@ def get_pos_invoices():
         if not opening_entry:
             return jsonify({"message": "Opening entry not found", "status": "error"}), 404
         period_start = opening_entry['period_start_date']
-        invoices = list(sales_collection.find({"date": {"$gte": period_start}}))
-        invoices = [convert_objectid_to_str(inv) for inv in invoices]
-        total = sum(float(inv['grand_total']) for inv in invoices)
-        net_total = sum(float(inv['total']) for inv in invoices)
-        total_qty = sum(sum(item['quantity'] for item in inv['items']) for inv in invoices)
+        # Totals and invoice stubs are computed by MongoDB in one round trip so
+        # closing a busy shift does not pull every invoice into the app server.
+        result = next(sales_collection.aggregate([
+            {"$match": {"date": {"$gte": period_start}}},
+            {"$facet": {
+                "totals": [
+                    {"$unwind": {"path": "$items", "preserveNullAndEmptyArrays": True}},
+                    {"$group": {
+                        "_id": "$_id",
+                        "grand_total": {"$first": {"$toDouble": "$grand_total"}},
+                        "net_total": {"$first": {"$toDouble": "$total"}},
+                        "quantity": {"$sum": {"$ifNull": ["$items.quantity", 0]}}
+                    }},
+                    {"$group": {
+                        "_id": None,
+                        "grand_total": {"$sum": "$grand_total"},
+                        "net_total": {"$sum": "$net_total"},
+                        "total_quantity": {"$sum": "$quantity"}
+                    }}
+                ],
+                "invoices": [
+                    {"$project": {"_id": 0, "pos_invoice": "$invoice_no", "grand_total": 1, "posting_date": "$date", "customer": 1}}
+                ]
+            }}
+        ]))
+        totals = result['totals'][0] if result['totals'] else {}
+        total = totals.get('grand_total', 0)
+        net_total = totals.get('net_total', 0)
         taxes = [{"account_head": "VAT", "rate": 10, "amount": total - net_total}]
         response = {
-            "invoices": [{"pos_invoice": inv['invoice_no'], "grand_total": inv['grand_total'], "posting_date": inv['date'], "customer": inv['customer']} for inv in invoices],
+            "invoices": result['invoices'],
             "taxes": taxes,
             "grand_total": total,
             "net_total": net_total,
-            "total_quantity": total_qty,
+            "total_quantity": totals.get('total_quantity', 0),
             "status": "success"
         }
         logger.info(f"Fetched POS invoices for opening entry: {pos_opening_entry}")
@@ -1637,10 +2459,14 @@ def create_closing_entry():
 def get_kitchens():
     """Fetch all kitchens."""
     try:
+        etag = catalog_etag('kitchens')
+        response = not_modified(etag)
+        if response:
+            return response
         kitchens = list(kitchens_collection.find())
         kitchens = [convert_objectid_to_str(kitchen) for kitchen in kitchens]
         logger.info(f"Fetched {len(kitchens)} kitchens")
-        return jsonify(kitchens), 200
+        return with_etag(jsonify(kitchens), etag), 200
     except Exception as e:
         logger.error(f"Error fetching kitchens: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -1662,6 +2488,7 @@ def create_kitchen():
             "created_at": datetime.now(UTC).isoformat()
         }
         result = kitchens_collection.insert_one(new_kitchen)
+        bump_catalog_version('kitchens')
         logger.info(f"Kitchen created: {kitchen_name}")
         return jsonify({"message": "Kitchen created successfully", "id": str(result.inserted_id)}), 201
     except Exception as e:
@@ -1688,6 +2515,7 @@ def update_kitchen(kitchen_id):
         if result.matched_count == 0:
             logger.warning(f"Kitchen not found for update: {kitchen_id}")
             return jsonify({"error": "Kitchen not found"}), 404
+        bump_catalog_version('kitchens')
         logger.info(f"Kitchen updated: {kitchen_id}")
         return jsonify({"message": "Kitchen updated successfully"}), 200
     except Exception as e:
@@ -1707,6 +2535,7 @@ def delete_kitchen(kitchen_id):
         if result.deleted_count == 0:
             logger.warning(f"Kitchen not found for deletion: {kitchen_id}")
             return jsonify({"error": "Kitchen not found"}), 404
+        bump_catalog_version('kitchens')
         logger.info(f"Kitchen deleted: {kitchen_id}")
         return jsonify({"message": "Kitchen deleted successfully"}), 200
     except Exception as e:
@@ -1717,10 +2546,14 @@ def delete_kitchen(kitchen_id):
 def get_item_groups():
     """Fetch all item groups."""
     try:
+        etag = catalog_etag('item_groups')
+        response = not_modified(etag)
+        if response:
+            return response
         item_groups = list(item_groups_collection.find())
         item_groups = [convert_objectid_to_str(group) for group in item_groups]
         logger.info(f"Fetched {len(item_groups)} item groups")
-        return jsonify(item_groups), 200
+        return with_etag(jsonify(item_groups), etag), 200
     except Exception as e:
         logger.error(f"Error fetching item groups: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -1742,6 +2575,7 @@ def create_item_group():
             "created_at": datetime.now(UTC).isoformat()
         }
         result = item_groups_collection.insert_one(new_group)
+        bump_catalog_version('item_groups')
         logger.info(f"Item group created: {group_name}")
         return jsonify({"message": "Item group created successfully", "id": str(result.inserted_id)}), 201
     except Exception as e:
@@ -1768,6 +2602,7 @@ def update_item_group(group_id):
         if result.matched_count == 0:
             logger.warning(f"Item group not found for update: {group_id}")
             return jsonify({"error": "Item group not found"}), 404
+        bump_catalog_version('item_groups')
         logger.info(f"Item group updated: {group_id}")
         return jsonify({"message": "Item group updated successfully"}), 200
     except Exception as e:
@@ -1787,6 +2622,7 @@ def delete_item_group(group_id):
         if result.deleted_count == 0:
             logger.warning(f"Item group not found for deletion: {group_id}")
             return jsonify({"error": "Item group not found"}), 404
+        bump_catalog_version('item_groups')
         logger.info(f"Item group deleted: {group_id}")
         return jsonify({"message": "Item group deleted successfully"}), 200
     except Exception as e:
@@ -1882,6 +2718,7 @@ def save_item_nutrition():
         if updated_count == 0:
             logger.error(f"No items updated for {item_type}: {item_name}")
             return jsonify({"error": "No items updated, please check instance data"}), 400
+        invalidate_menu_snapshot()
 
         logger.info(f"Ingredients updated for {item_type}: {item_name} across {updated_count} instances")
         return jsonify({"message": "Ingredients saved successfully"}), 200
@@ -2003,6 +2840,7 @@ def handle_item_nutrition(item_name):
             if deleted_count == 0:
                 logger.error(f"No items updated for deletion of {item_type}: {item_name}")
                 return jsonify({"error": "No items updated for deletion, please check instance data"}), 400
+            invalidate_menu_snapshot()
 
             logger.info(f"Nutrition and ingredients cleared for {item_type}: {item_name} across {deleted_count} instances")
             return jsonify({"message": "Nutrition and ingredients cleared successfully"}), 200
@@ -2014,62 +2852,39 @@ def handle_item_nutrition(item_name):
 
 
 
+# Kitchen orders
+# activeorders is the only order store; the kitchen-saved routes are kept for
+# older clients and read a kitchen-facing projection of it.
+KITCHEN_ORDER_PROJECTION = {
+    '_id': 0, 'orderId': 1, 'orderNo': 1, 'customerName': 1, 'tableNumber': 1,
+    'chairsBooked': 1, 'orderType': 1, 'status': 1, 'timestamp': 1,
+    'pickedUpTime': 1, 'cartItems': 1
+}
+# Per-item fields PATCH /api/activeorders/<id>/items may change in place.
+CART_ITEM_PATCH_FIELDS = ('quantity', 'totalPrice')
+
+def item_required_kitchens(item):
+    """Return the kitchens a cart item, its addons and its combos need."""
+    required_kitchens = set()
+    if item.get('kitchen'):
+        required_kitchens.add(item['kitchen'])
+    for addon_name, qty in item.get('addonQuantities', {}).items():
+        if qty > 0 and item.get('addonVariants', {}).get(addon_name, {}).get('kitchen'):
+            required_kitchens.add(item['addonVariants'][addon_name]['kitchen'])
+    for combo_name, qty in item.get('comboQuantities', {}).items():
+        if qty > 0 and item.get('comboVariants', {}).get(combo_name, {}).get('kitchen'):
+            required_kitchens.add(item['comboVariants'][combo_name]['kitchen'])
+    return required_kitchens
+
 @app.route('/api/kitchen-saved', methods=['POST'])
 def save_kitchen_order():
+    """Legacy endpoint: orders reach the kitchen through /api/activeorders."""
     try:
         data = request.get_json()
         if not data or 'orderId' not in data:
             return jsonify({'success': False, 'error': 'No data or orderId provided'}), 400
-
-        order_id = data['orderId']
-        existing_order = kitchen_saved_collection.find_one({'orderId': order_id})
-        
-        cart_items = data.get('cartItems', [])
-        for item in cart_items:
-            required_kitchens = set()
-            if 'kitchen' in item:
-                required_kitchens.add(item['kitchen'])
-            for addon_name, qty in item.get('addonQuantities', {}).items():
-                if qty > 0 and 'addonVariants' in item and addon_name in item['addonVariants']:
-                    addon = item['addonVariants'][addon_name]
-                    if 'kitchen' in addon:
-                        required_kitchens.add(addon['kitchen'])
-            for combo_name, qty in item.get('comboQuantities', {}).items():
-                if qty > 0 and 'comboVariants' in item and combo_name in item['comboVariants']:
-                    combo = item['comboVariants'][combo_name]
-                    if 'kitchen' in combo:
-                        required_kitchens.add(combo['kitchen'])
-            item['requiredKitchens'] = list(required_kitchens)
-            item['kitchenStatuses'] = item.get('kitchenStatuses', {kitchen: 'Pending' for kitchen in required_kitchens})
-
-        order = {
-            'orderId': order_id,
-            'customerName': data.get('customerName', 'N/A'),
-            'tableNumber': data.get('tableNumber', 'N/A'),
-            'chairsBooked': data.get('chairsBooked', []),
-            'phoneNumber': data.get('phoneNumber', ''),
-            'deliveryAddress': data.get('deliveryAddress', {}),
-            'whatsappNumber': data.get('whatsappNumber', ''),
-            'email': data.get('email', ''),
-            'cartItems': cart_items,
-            'timestamp': data.get('timestamp', datetime.utcnow().isoformat()),
-            'orderType': data.get('orderType', 'Dine In'),
-            'createdAt': datetime.utcnow(),
-            'status': data.get('status', 'Pending'),
-            'pickedUpTime': data.get('pickedUpTime', None)
-        }
-
-        if existing_order:
-            kitchen_saved_collection.update_one(
-                {'orderId': order_id},
-                {'$set': order}
-            )
-            logger.info(f"Updated kitchen order: {order_id}")
-        else:
-            kitchen_saved_collection.insert_one(order)
-            logger.info(f"Created kitchen order: {order_id}")
-
-        return jsonify({'success': True, 'order_id': order_id}), 201
+        logger.info(f"Ignored kitchen-saved write for order {data['orderId']}; kitchens read active orders")
+        return jsonify({'success': True, 'order_id': data['orderId']}), 200
     except Exception as e:
         logger.error(f"Error in /api/kitchen-saved POST: {str(e)}")
         logger.error(traceback.format_exc())
@@ -2078,7 +2893,7 @@ def save_kitchen_order():
 @app.route('/api/kitchen-saved', methods=['GET'])
 def get_kitchen_orders():
     try:
-        orders = list(kitchen_saved_collection.find({}, {'_id': 0}))
+        orders = list(activeorders_collection.find({}, KITCHEN_ORDER_PROJECTION))
         return jsonify({'success': True, 'orders': orders}), 200
     except Exception as e:
         logger.error(f"Error in /api/kitchen-saved GET: {str(e)}")
@@ -2087,12 +2902,13 @@ def get_kitchen_orders():
 
 @app.route('/api/kitchen-saved/<order_id>', methods=['DELETE'])
 def delete_kitchen_order(order_id):
+    """Legacy endpoint: there is no separate kitchen copy to clear any more.
+
+    Deleting here must not remove the live order, which the POS and billing
+    still need; orders are deleted through /api/activeorders.
+    """
     try:
-        result = kitchen_saved_collection.delete_one({'orderId': order_id})
-        if result.deleted_count == 0:
-            logger.warning(f"Order not found: {order_id}")
-            return jsonify({'success': False, 'error': 'Order not found'}), 404
-        logger.info(f"Order deleted: {order_id}")
+        logger.info(f"Ignored kitchen-saved delete for order {order_id}; the active order is kept")
         return jsonify({'success': True, 'message': 'Order deleted successfully'}), 200
     except Exception as e:
         logger.error(f"Error deleting order {order_id}: {str(e)}")
@@ -2107,7 +2923,7 @@ def mark_item_prepared(order_id, item_id):
         if not kitchen:
             return jsonify({'success': False, 'error': 'Kitchen not provided'}), 400
 
-        order = kitchen_saved_collection.find_one({'orderId': order_id})
+        order = activeorders_collection.find_one({'orderId': order_id}, {'_id': 0, 'cartItems': 1})
         if not order:
             return jsonify({'success': False, 'error': 'Order not found'}), 404
 
@@ -2121,19 +2937,16 @@ def mark_item_prepared(order_id, item_id):
         if not item.get('kitchenStatuses'):
             item['kitchenStatuses'] = {k: 'Pending' for k in item['requiredKitchens']}
 
-        if item['kitchenStatuses'][kitchen] in ['Prepared', 'PickedUp']:
+        if item['kitchenStatuses'].get(kitchen) in ['Prepared', 'PickedUp']:
             return jsonify({'success': False, 'error': 'Kitchen already marked as prepared or picked up'}), 400
 
         item['kitchenStatuses'][kitchen] = 'Prepared'
 
-        kitchen_saved_collection.update_one(
-            {'orderId': order_id, 'cartItems.id': item_id},
-            {'$set': {'cartItems.$.kitchenStatuses': item['kitchenStatuses']}}
-        )
         activeorders_collection.update_one(
             {'orderId': order_id, 'cartItems.id': item_id},
             {'$set': {'cartItems.$.kitchenStatuses': item['kitchenStatuses']}}
         )
+        publish_kitchen_event('item_status', {kitchen}, {'orderId': order_id, 'itemId': item_id, 'kitchen': kitchen, 'status': 'Prepared'})
 
         return jsonify({'success': True, 'status': 'Prepared'}), 200
     except Exception as e:
@@ -2151,6 +2964,56 @@ def convert_objectid_to_str(data):
         return str(data)
     return data
 
+# Picked-up log
+# Pick-ups are appended with one $push into a document per customer, table and
+# hour. A bucket holds at most PICKED_UP_BUCKET_SIZE items, after which the next
+# pick-up opens a new one, so writes never rewrite a growing array. Buckets of
+# the same hour are numbered by seq and the unique index on (customerName,
+# tableNumber, bucket, seq) stops two concurrent pick-ups opening the same one.
+PICKED_UP_BUCKET_SIZE = 100
+PICKED_UP_APPEND_ATTEMPTS = 5
+
+def append_picked_up_item(customer_name, table_number, order_type, item):
+    """Append item to the current bucket; return (bucket id, created).
+
+    When no bucket has room, a new one is inserted with the next seq. If another
+    writer inserts that seq first, the insert raises DuplicateKeyError and the
+    append is retried against the bucket the other writer opened.
+    """
+    now = datetime.utcnow().isoformat()
+    bucket_key = {'customerName': customer_name, 'tableNumber': table_number, 'bucket': now[:13]}
+    for attempt in range(PICKED_UP_APPEND_ATTEMPTS):
+        entry = picked_up_collection.find_one_and_update(
+            {**bucket_key, 'itemCount': {'$lt': PICKED_UP_BUCKET_SIZE}},
+            {
+                '$push': {'items': item},
+                '$inc': {'itemCount': 1},
+                '$set': {'pickupTime': now, 'modified_at': now}
+            },
+            projection={'_id': 1},
+            sort=[('seq', -1)]
+        )
+        if entry:
+            return entry['_id'], False
+
+        last = picked_up_collection.find_one(bucket_key, {'seq': 1}, sort=[('seq', -1)])
+        bucket = {
+            **bucket_key,
+            'seq': (last.get('seq', -1) + 1) if last else 0,
+            'orderType': order_type,
+            'items': [item],
+            'itemCount': 1,
+            'pickupTime': now,
+            'created_at': now,
+            'modified_at': now
+        }
+        try:
+            result = picked_up_collection.insert_one(bucket)
+            return result.inserted_id, True
+        except DuplicateKeyError:
+            logger.debug(f"Picked-up bucket {bucket_key} seq {bucket['seq']} already opened, retrying")
+    raise RuntimeError(f"Could not append picked-up item after {PICKED_UP_APPEND_ATTEMPTS} attempts")
+
 # Save picked-up item (POST /api/picked-up-items)
 @app.route('/api/picked-up-items', methods=['POST'])
 def save_picked_up_item():
@@ -2162,7 +3025,6 @@ def save_picked_up_item():
 
         customer_name = item_data.get('customerName', 'Unknown')
         table_number = item_data.get('tableNumber', 'N/A')
-        pickup_time = datetime.utcnow().isoformat()
 
         new_item = {
             'itemName': item_data.get('itemName', 'Unknown'),
@@ -2173,46 +3035,20 @@ def save_picked_up_item():
             'selectedCombos': item_data.get('selectedCombos', [])
         }
 
-        existing_entry = picked_up_collection.find_one({
-            'customerName': customer_name,
-            'tableNumber': table_number
-        })
-
-        if existing_entry:
-            updated_items = existing_entry.get('items', [])
-            updated_items.append(new_item)
-            result = picked_up_collection.update_one(
-                {'_id': existing_entry['_id']},
-                {
-                    '$set': {
-                        'items': updated_items,
-                        'pickupTime': pickup_time,
-                        'modified_at': datetime.utcnow().isoformat()
-                    }
-                }
-            )
-            logger.info(f"Picked-up items updated for customer: {customer_name}, table: {table_number}")
-            return jsonify({
-                'success': True,
-                'message': 'Picked-up items updated successfully',
-                'id': str(existing_entry['_id'])
-            }), 200
-        else:
-            picked_up_data = {
-                'customerName': customer_name,
-                'tableNumber': table_number,
-                'items': [new_item],
-                'pickupTime': pickup_time,
-                'created_at': datetime.utcnow().isoformat(),
-                'orderType': item_data.get('orderType', 'N/A')
-            }
-            result = picked_up_collection.insert_one(picked_up_data)
-            logger.info(f"Picked-up items saved with ID: {result.inserted_id}")
+        entry_id, created = append_picked_up_item(customer_name, table_number, item_data.get('orderType', 'N/A'), new_item)
+        if created:
+            logger.info(f"Picked-up items saved with ID: {entry_id}")
             return jsonify({
                 'success': True,
                 'message': 'Picked-up items saved successfully',
-                'id': str(result.inserted_id)
+                'id': str(entry_id)
             }), 201
+        logger.info(f"Picked-up items updated for customer: {customer_name}, table: {table_number}")
+        return jsonify({
+            'success': True,
+            'message': 'Picked-up items updated successfully',
+            'id': str(entry_id)
+        }), 200
 
     except Exception as e:
         logger.error(f"Error saving picked-up items: {str(e)}")
@@ -2223,6 +3059,9 @@ def save_picked_up_item():
 @app.route('/api/picked-up-items', methods=['GET'])
 def get_picked_up_items():
     try:
+        if request.args.get('format') == 'ndjson':
+            logger.info("Streaming picked-up item entries as NDJSON")
+            return ndjson_response(picked_up_collection.find({}))
         picked_up_items = list(picked_up_collection.find({}))
         # Convert ObjectId to string for JSON serialization
         picked_up_items = convert_objectid_to_str(picked_up_items)
@@ -2278,6 +3117,7 @@ def create_variants():
 
         # Insert variant into MongoDB
         result = variants_collection.insert_one(data)
+        bump_catalog_version('variants')
         return jsonify({
             'message': 'Variant created successfully',
             'inserted_id': str(result.inserted_id)
@@ -2290,12 +3130,16 @@ def create_variants():
 @app.route('/api/variants', methods=['GET'])
 def get_variants():
     try:
+        etag = catalog_etag('variants')
+        response = not_modified(etag)
+        if response:
+            return response
         # Retrieve all variants from MongoDB
         variants = list(variants_collection.find({}, {'_id': 1, 'heading': 1, 'subheadings': 1, 'activeSection': 1}))
         # Convert ObjectId to string
         for variant in variants:
             variant['_id'] = str(variant['_id'])
-        return jsonify(variants), 200
+        return with_etag(jsonify(variants), etag), 200
     except Exception as e:
         return jsonify({'error': f"Server error: {str(e)}"}), 500
 
@@ -2346,6 +3190,7 @@ def update_variant(id):
         )
         if result.matched_count == 0:
             return jsonify({'error': 'Variant not found'}), 404
+        bump_catalog_version('variants')
         return jsonify({'message': 'Variant updated successfully'}), 200
     except Exception as e:
         return jsonify({'error': f"Server error: {str(e)}"}), 500
@@ -2360,6 +3205,7 @@ def delete_variant(id):
         result = variants_collection.delete_one({'_id': ObjectId(id)})
         if result.deleted_count == 0:
             return jsonify({'error': 'Variant not found'}), 404
+        bump_catalog_version('variants')
         return jsonify({'message': 'Variant deleted successfully'}), 200
     except Exception as e:
         return jsonify({'error': f"Server error: {str(e)}"}), 500
@@ -2369,6 +3215,7 @@ def delete_variant(id):
 def delete_variant_by_heading(heading):
     try:
         result = variants_collection.delete_one({'heading': heading})
+        bump_catalog_version('variants')
         return jsonify({'message': 'Variant deleted successfully'}), 200
     except Exception as e:
         return jsonify({'error': f"Server error: {str(e)}"}), 500
@@ -2540,16 +3387,166 @@ def delete_employee(employee_id):
 def generate_unique_id():
     return str(uuid.uuid4())
 
-def generate_order_number(order_type):
-    """Generate order number based on order type (e.g., T0001, D0001, ON001)."""
-    prefix = {'Dine In': 'D', 'Take Away': 'T', 'Online Delivery': 'ON'}.get(order_type, 'D')
+# Kitchen event stream
+# Order routes publish deltas here; each /api/stream/kitchen/<name> connection
+# holds a bounded queue and receives only events for orders touching its kitchen,
+# while /api/stream/kitchens receives every event. An open stream occupies a
+# server worker thread for as long as the display is connected, so the number of
+# streams is capped and Waitress gets that many threads on top of its pool.
+KITCHEN_STREAM_QUEUE_SIZE = 256
+KITCHEN_STREAM_HEARTBEAT = 15  # seconds between keep-alive comments
+KITCHEN_STREAM_MAX_SUBSCRIBERS = int(os.getenv('KITCHEN_STREAM_MAX_SUBSCRIBERS', 4))
+kitchen_subscribers_lock = threading.Lock()
+kitchen_subscribers = []  # (kitchen_name or None for all kitchens, queue.Queue)
+
+def order_kitchens(order):
+    """Return every kitchen any cart item in the order needs."""
+    kitchens = set()
+    for item in (order or {}).get('cartItems', []):
+        kitchens.update(item.get('requiredKitchens', []))
+    return kitchens
+
+def kitchen_stream_metrics():
+    with kitchen_subscribers_lock:
+        return {'open': len(kitchen_subscribers), 'max': KITCHEN_STREAM_MAX_SUBSCRIBERS}
+
+def publish_kitchen_event(event_type, kitchens, payload):
+    """Queue an event for every stream subscribed to one of kitchens."""
+    event = {'type': event_type, 'data': convert_objectid_to_str(payload)}
+    with kitchen_subscribers_lock:
+        subscribers = [q for name, q in kitchen_subscribers if name is None or name in kitchens]
+    for subscriber in subscribers:
+        try:
+            subscriber.put_nowait(event)
+        except queue.Full:
+            # The client fell behind; drop its backlog and tell it to refetch.
+            with subscriber.mutex:
+                subscriber.queue.clear()
+            subscriber.put_nowait({'type': 'resync', 'data': {}})
+
+@app.route('/api/stream/kitchens', methods=['GET'])
+@app.route('/api/stream/kitchen/<kitchen_name>', methods=['GET'])
+def stream_kitchen(kitchen_name=None):
+    """Server-Sent Events stream of order changes for one kitchen, or all of them."""
+    label = kitchen_name or 'all kitchens'
+    subscriber = queue.Queue(maxsize=KITCHEN_STREAM_QUEUE_SIZE)
+    entry = (kitchen_name, subscriber)
+    with kitchen_subscribers_lock:
+        accepted = len(kitchen_subscribers) < KITCHEN_STREAM_MAX_SUBSCRIBERS
+        if accepted:
+            kitchen_subscribers.append(entry)
+    if not accepted:
+        logger.warning(f"Refused kitchen stream for {label}: {KITCHEN_STREAM_MAX_SUBSCRIBERS} streams already open")
+        return jsonify({'error': 'Too many kitchen streams open; poll /api/activeorders instead'}), 503, {'Retry-After': '30'}
+    logger.info(f"Kitchen stream opened for {label}")
+
+    def unsubscribe():
+        # Runs from the generator and from the response close hook, since a
+        # client can disconnect before the generator ever starts.
+        with kitchen_subscribers_lock:
+            if entry not in kitchen_subscribers:
+                return
+            kitchen_subscribers.remove(entry)
+        logger.info(f"Kitchen stream closed for {label}")
+
+    def format_event(event):
+        return f"event: {event['type']}\ndata: {json.dumps(event['data'], default=json_default)}\n\n"
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            query = {} if kitchen_name is None else {'cartItems.requiredKitchens': kitchen_name}
+            orders = list(activeorders_collection.find(query, {'_id': 0}))
+            yield format_event({'type': 'snapshot', 'data': {'orders': orders}})
+            while True:
+                try:
+                    event = subscriber.get(timeout=KITCHEN_STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(event)
+        finally:
+            unsubscribe()
+
+    response = Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    response.call_on_close(unsubscribe)
+    return response
+
+# Order numbers
+# Each process reserves ORDER_NUMBER_BLOCK_SIZE numbers per order type with one
+# atomic $inc on order_counters and hands them out locally, so a rush costs one
+# round trip per block instead of one per order. Numbers are monotonic within a
+# process; a restart or a reset abandons the rest of a block, leaving a gap.
+# With the 'daily' policy (orderNumberReset in system settings, or the
+# ORDER_NUMBER_RESET env var) numbering restarts at orderNumberResetTime,
+# local time, each day.
+ORDER_NUMBER_BLOCK_SIZE = int(os.getenv('ORDER_NUMBER_BLOCK_SIZE', 50))
+ORDER_NUMBER_PREFIXES = {'Dine In': 'D', 'Take Away': 'T', 'Online Delivery': 'ON'}
+ORDER_NUMBER_RESET_POLICIES = ('never', 'daily')
+order_number_lock = threading.Lock()
+order_number_blocks = {}
+
+def parse_reset_time(value):
+    """Parse an HH:MM reset time into (hours, minutes); None if it is malformed."""
+    match = re.fullmatch(r'(\d{1,2}):(\d{2})', str(value).strip())
+    if not match:
+        return None
+    hours, minutes = int(match.group(1)), int(match.group(2))
+    if hours > 23 or minutes > 59:
+        return None
+    return hours, minutes
+
+def order_number_period():
+    """The current numbering period: None when numbers never reset, else the business day."""
+    settings = get_system_settings()
+    policy = os.getenv('ORDER_NUMBER_RESET', settings.get('orderNumberReset', 'never'))
+    if policy != 'daily':
+        return None
+    reset_time = os.getenv('ORDER_NUMBER_RESET_TIME', settings.get('orderNumberResetTime', '00:00'))
+    parsed = parse_reset_time(reset_time)
+    if parsed is None:
+        logger.warning(f"Invalid order number reset time {reset_time!r}; resetting at 00:00")
+        parsed = (0, 0)
+    hours, minutes = parsed
+    return (datetime.now() - timedelta(hours=hours, minutes=minutes)).date().isoformat()
+
+def reserve_order_number_block(order_type, period):
+    """Reserve the next block for order_type and return its last number."""
+    if period is None:
+        update = {'$inc': {'counter': ORDER_NUMBER_BLOCK_SIZE}}
+    else:
+        # Pipeline update: continue within the same period, restart when it changes
+        update = [{'$set': {
+            'counter': {'$cond': [
+                {'$eq': ['$period', period]},
+                {'$add': ['$counter', ORDER_NUMBER_BLOCK_SIZE]},
+                ORDER_NUMBER_BLOCK_SIZE
+            ]},
+            'period': period
+        }}]
     counter = order_counters_collection.find_one_and_update(
         {'order_type': order_type},
-        {'$inc': {'counter': 1}},
+        update,
         upsert=True,
-        return_document=True
+        return_document=ReturnDocument.AFTER
     )
-    number = counter['counter']
+    return counter['counter']
+
+def generate_order_number(order_type):
+    """Generate order number based on order type (e.g., T0001, D0001, ON001)."""
+    prefix = ORDER_NUMBER_PREFIXES.get(order_type, 'D')
+    period = order_number_period()
+    with order_number_lock:
+        block = order_number_blocks.get(order_type)
+        if block is None or block['period'] != period or block['next'] > block['last']:
+            last = reserve_order_number_block(order_type, period)
+            block = {'period': period, 'next': last - ORDER_NUMBER_BLOCK_SIZE + 1, 'last': last}
+            order_number_blocks[order_type] = block
+        number = block['next']
+        block['next'] += 1
     if prefix == 'ON':
         return f'{prefix}{number:03d}'  # e.g., ON001
     return f'{prefix}{number:04d}'  # e.g., D0001, T0001
@@ -2581,20 +3578,7 @@ def save_active_order():
 
         cart_items = data.get('cartItems', [])
         for item in cart_items:
-            required_kitchens = set()
-            if item.get('kitchen'):
-                required_kitchens.add(item['kitchen'])
-            
-            for addon_name, qty in item.get('addonQuantities', {}).items():
-                if qty > 0 and 'addonVariants' in item and addon_name in item['addonVariants']:
-                    if item['addonVariants'][addon_name].get('kitchen'):
-                        required_kitchens.add(item['addonVariants'][addon_name]['kitchen'])
-            
-            for combo_name, qty in item.get('comboQuantities', {}).items():
-                if qty > 0 and 'comboVariants' in item and combo_name in item['comboVariants']:
-                    if item['comboVariants'][combo_name].get('kitchen'):
-                        required_kitchens.add(item['comboVariants'][combo_name]['kitchen'])
-
+            required_kitchens = item_required_kitchens(item)
             item['requiredKitchens'] = list(required_kitchens)
             item['kitchenStatuses'] = {kitchen: 'Pending' for kitchen in required_kitchens}
 
@@ -2619,7 +3603,7 @@ def save_active_order():
         }
 
         activeorders_collection.insert_one(active_order)
-        kitchen_saved_collection.insert_one(active_order.copy())
+        publish_kitchen_event('order_created', order_kitchens(active_order), {'order': active_order})
 
         logger.info(f"Created order: {order_id} with order number: {order_no}")
         return jsonify({'success': True, 'orderId': order_id, 'orderNo': order_no}), 201
@@ -2649,12 +3633,12 @@ def mark_item_prepared_active(order_id, item_id):
         if not kitchen:
             return jsonify({'success': False, 'error': 'Kitchen not provided'}), 400
 
-        for collection in [activeorders_collection, kitchen_saved_collection]:
-            collection.update_one(
-                {'orderId': order_id, 'cartItems.id': item_id},
-                {'$set': {f'cartItems.$.kitchenStatuses.{kitchen}': 'Prepared'}}
-            )
-        
+        activeorders_collection.update_one(
+            {'orderId': order_id, 'cartItems.id': item_id},
+            {'$set': {f'cartItems.$.kitchenStatuses.{kitchen}': 'Prepared'}}
+        )
+
+        publish_kitchen_event('item_status', {kitchen}, {'orderId': order_id, 'itemId': item_id, 'kitchen': kitchen, 'status': 'Prepared'})
         logger.info(f"Marked item {item_id} in order {order_id} as Prepared for kitchen {kitchen}")
         return jsonify({'success': True, 'status': 'Prepared'}), 200
     except Exception as e:
@@ -2671,47 +3655,42 @@ def mark_item_pickedup_active(order_id, item_id):
         if not kitchen:
             return jsonify({'success': False, 'error': 'Kitchen not provided'}), 400
 
-        order = activeorders_collection.find_one({'orderId': order_id}, {'_id': 0})
+        # Flip Prepared -> PickedUp only if it is still Prepared, so two
+        # expeditors cannot both pick up the same item.
+        order = activeorders_collection.find_one_and_update(
+            {'orderId': order_id, 'cartItems': {'$elemMatch': {'id': item_id, f'kitchenStatuses.{kitchen}': 'Prepared'}}},
+            {'$set': {f'cartItems.$.kitchenStatuses.{kitchen}': 'PickedUp'}},
+            projection={'_id': 0, 'customerName': 1, 'tableNumber': 1, 'orderType': 1, 'cartItems': {'$elemMatch': {'id': item_id}}}
+        )
         if not order:
-            return jsonify({'success': False, 'error': 'Order not found'}), 404
-
-        item = next((item for item in order['cartItems'] if item['id'] == item_id), None)
-        if not item:
-            return jsonify({'success': False, 'error': 'Item not found'}), 404
-        
-        if item.get('kitchenStatuses', {}).get(kitchen) != 'Prepared':
+            # Only the failure path pays for a second read, to report why.
+            order = activeorders_collection.find_one({'orderId': order_id}, {'_id': 0, 'cartItems': {'$elemMatch': {'id': item_id}}})
+            if not order:
+                return jsonify({'success': False, 'error': 'Order not found'}), 404
+            if not order.get('cartItems'):
+                return jsonify({'success': False, 'error': 'Item not found'}), 404
             return jsonify({'success': False, 'error': 'Item must be prepared before picking up'}), 400
-
-        for collection in [activeorders_collection, kitchen_saved_collection]:
-            collection.update_one(
-                {'orderId': order_id, 'cartItems.id': item_id},
-                {'$set': {f'cartItems.$.kitchenStatuses.{kitchen}': 'PickedUp'}}
-            )
-
-        picked_up_data = {
-            'customerName': order.get('customerName', 'Unknown'),
-            'tableNumber': order.get('tableNumber', 'N/A'),
-            'orderType': order.get('orderType', 'Dine In'),
-            'pickupTime': datetime.utcnow().isoformat(),
-            'items': [{
-                'itemName': item.get('name', 'Unknown'),
-                'quantity': item.get('quantity', 0),
-                'category': item.get('category', 'N/A'),
-                'kitchen': kitchen,
-                'addonCounts': [
-                    {'name': name, 'quantity': qty}
-                    for name, qty in item.get('addonQuantities', {}).items()
-                    if qty > 0 and item.get('addonVariants', {}).get(name, {}).get('kitchen') == kitchen
-                ],
-                'selectedCombos': [
-                    {'name': name, 'size': item['comboVariants'][name]['size'], 'quantity': qty}
-                    for name, qty in item.get('comboQuantities', {}).items()
-                    if qty > 0 and item.get('comboVariants', {}).get(name, {}).get('kitchen') == kitchen
-                ]
-            }]
+        item = order['cartItems'][0]
+
+        picked_up_item = {
+            'itemName': item.get('name', 'Unknown'),
+            'quantity': item.get('quantity', 0),
+            'category': item.get('category', 'N/A'),
+            'kitchen': kitchen,
+            'addonCounts': [
+                {'name': name, 'quantity': qty}
+                for name, qty in item.get('addonQuantities', {}).items()
+                if qty > 0 and item.get('addonVariants', {}).get(name, {}).get('kitchen') == kitchen
+            ],
+            'selectedCombos': [
+                {'name': name, 'size': item['comboVariants'][name]['size'], 'quantity': qty}
+                for name, qty in item.get('comboQuantities', {}).items()
+                if qty > 0 and item.get('comboVariants', {}).get(name, {}).get('kitchen') == kitchen
+            ]
         }
-        picked_up_collection.insert_one(picked_up_data)
+        append_picked_up_item(order.get('customerName', 'Unknown'), order.get('tableNumber', 'N/A'), order.get('orderType', 'Dine In'), picked_up_item)
         
+        publish_kitchen_event('item_status', {kitchen}, {'orderId': order_id, 'itemId': item_id, 'kitchen': kitchen, 'status': 'PickedUp'})
         logger.info(f"Marked item {item_id} in order {order_id} as PickedUp for kitchen {kitchen}")
         return jsonify({'success': True, 'status': 'PickedUp'}), 200
     except Exception as e:
@@ -2719,6 +3698,111 @@ def mark_item_pickedup_active(order_id, item_id):
         logger.error(traceback.format_exc())
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Route to apply a cart diff to an active order
+# Body: {"add": [item, ...], "remove": [itemId, ...],
+#        "update": [{"id": itemId, "quantity": n, "totalPrice": x}, ...]}
+# Each kind of change is one targeted update; MongoDB rejects $push, $pull and
+# positional $set on cartItems in the same update, so a mixed diff costs one
+# round trip per kind and the last one returns the new order. A mixed diff is
+# therefore not atomic: if the order is deleted between steps the response is
+# 404 with "partiallyApplied": true and the earlier steps stay applied.
+@app.route('/api/activeorders/<order_id>/items', methods=['PATCH'])
+def patch_active_order_items(order_id):
+    try:
+        data = request.get_json() or {}
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Body must be a JSON object'}), 400
+        for key in ('add', 'remove', 'update'):
+            if not isinstance(data.get(key, []), list):
+                return jsonify({'error': f'{key} must be a list'}), 400
+        added = data.get('add', [])
+        if not all(isinstance(item, dict) and isinstance(item.get('id', ''), (str, int)) for item in added):
+            return jsonify({'error': 'Every added item must be an object with a string or integer id'}), 400
+        if not all(isinstance(item_id, (str, int)) and not isinstance(item_id, bool) for item_id in data.get('remove', [])):
+            return jsonify({'error': 'remove must be a list of item ids'}), 400
+        removed = set(data.get('remove', []))
+        updates = {}
+        for change in data.get('update', []):
+            if not isinstance(change, dict):
+                return jsonify({'error': 'Every update must be an object'}), 400
+            if not isinstance(change.get('id'), (str, int)) or isinstance(change['id'], bool):
+                return jsonify({'error': 'Every update needs an item id'}), 400
+            for field in CART_ITEM_PATCH_FIELDS:
+                value = change.get(field)
+                if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                    return jsonify({'error': f"{field} of item {change['id']} must be a number"}), 400
+            if change.get('quantity') is not None and change['quantity'] <= 0:
+                removed.add(change['id'])
+                continue
+            fields = {field: change[field] for field in CART_ITEM_PATCH_FIELDS if field in change}
+            if fields:
+                updates[change['id']] = fields
+        if not (added or removed or updates):
+            return jsonify({'error': 'No cart changes provided'}), 400
+
+        touched_kitchens = set()
+        for item in added:
+            item.setdefault('id', generate_unique_id())
+            required_kitchens = item_required_kitchens(item)
+            item['requiredKitchens'] = list(required_kitchens)
+            item['kitchenStatuses'] = {kitchen: 'Pending' for kitchen in required_kitchens}
+            touched_kitchens |= required_kitchens
+
+        steps = []
+        if removed:
+            steps.append(('remove', {'$pull': {'cartItems': {'id': {'$in': list(removed)}}}}, None))
+        if updates:
+            update = {'$set': {}}
+            array_filters = []
+            for n, (item_id, fields) in enumerate(updates.items()):
+                for field, value in fields.items():
+                    update['$set'][f'cartItems.$[i{n}].{field}'] = value
+                array_filters.append({f'i{n}.id': item_id})
+            steps.append(('update', update, array_filters))
+        if added:
+            steps.append(('add', {'$push': {'cartItems': {'$each': added}}}, None))
+
+        updated_order = None
+        unmatched = set()
+        for n, (kind, update, array_filters) in enumerate(steps):
+            last = n == len(steps) - 1
+            if kind == 'remove':
+                # Read the removed items' kitchens from the pre-image so their tickets drop.
+                projection = {'_id': 0} if last else {'_id': 0, 'cartItems.id': 1, 'cartItems.requiredKitchens': 1}
+                result = activeorders_collection.find_one_and_update(
+                    {'orderId': order_id}, update, projection=projection,
+                    return_document=ReturnDocument.BEFORE
+                )
+                if result:
+                    before_items = result.get('cartItems', [])
+                    unmatched |= removed - {item.get('id') for item in before_items}
+                    touched_kitchens |= order_kitchens({'cartItems': [item for item in before_items if item.get('id') in removed]})
+                    result['cartItems'] = [item for item in before_items if item.get('id') not in removed]
+            else:
+                result = activeorders_collection.find_one_and_update(
+                    {'orderId': order_id}, update, array_filters=array_filters,
+                    projection={'_id': 0} if last else {'_id': 0, 'cartItems.id': 1},
+                    return_document=ReturnDocument.AFTER
+                )
+                if result and kind == 'update':
+                    unmatched |= set(updates) - {item.get('id') for item in result.get('cartItems', [])}
+            if not result:
+                logger.warning(f"Order not found for item patch: {order_id} (after {n} of {len(steps)} steps)")
+                return jsonify({'error': 'Order not found', 'partiallyApplied': n > 0}), 404
+            updated_order = result
+
+        if updates:
+            touched_kitchens |= order_kitchens({'cartItems': [item for item in updated_order.get('cartItems', []) if item.get('id') in updates]})
+        publish_kitchen_event('order_updated', touched_kitchens, {'order': updated_order})
+        if unmatched:
+            logger.warning(f"Item patch for order {order_id} matched no cart item for ids: {sorted(unmatched, key=str)}")
+        logger.info(f"Patched items of order {order_id}: {len(added)} added, {len(removed)} removed, {len(updates)} updated")
+        return jsonify({'success': True, 'order': updated_order, 'unmatchedItemIds': sorted(unmatched, key=str)}), 200
+    except Exception as e:
+        logger.error(f"Error patching active order items: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
 # Route to update an active order
 @app.route('/api/activeorders/<order_id>', methods=['PUT'])
 def update_active_order(order_id):
@@ -2739,16 +3823,7 @@ def update_active_order(order_id):
 
         if 'cartItems' in data:
             for item in data['cartItems']:
-                required_kitchens = set()
-                if item.get('kitchen'):
-                    required_kitchens.add(item['kitchen'])
-                for addon_name, qty in item.get('addonQuantities', {}).items():
-                    if qty > 0 and item.get('addonVariants', {}).get(addon_name, {}).get('kitchen'):
-                        required_kitchens.add(item['addonVariants'][addon_name]['kitchen'])
-                for combo_name, qty in item.get('comboQuantities', {}).items():
-                    if qty > 0 and item.get('comboVariants', {}).get(combo_name, {}).get('kitchen'):
-                        required_kitchens.add(item['comboVariants'][combo_name]['kitchen'])
-                
+                required_kitchens = item_required_kitchens(item)
                 item['requiredKitchens'] = list(required_kitchens)
 
                 item_id = item.get('id')
@@ -2797,15 +3872,16 @@ def update_active_order(order_id):
             logger.info(f"Saved trip report for order {order_id} with delivery person {data['deliveryPersonId']}")
 
             activeorders_collection.delete_one({'orderId': order_id})
-            kitchen_saved_collection.delete_one({'orderId': order_id})
+            publish_kitchen_event('order_deleted', order_kitchens(order_in_db), {'orderId': order_id})
             logger.info(f"Deleted order {order_id} from active orders after delivery person assignment")
             return jsonify({'success': True, 'message': 'Delivery person assigned and order moved to trip reports', 'order': order_in_db}), 200
 
         result = activeorders_collection.update_one({'orderId': order_id}, {'$set': data})
-        kitchen_result = kitchen_saved_collection.update_one({'orderId': order_id}, {'$set': data})
 
         updated_order = activeorders_collection.find_one({'orderId': order_id}, {'_id': 0})
-        if result.modified_count > 0 or kitchen_result.modified_count > 0:
+        if result.modified_count > 0:
+            # Kitchens that lost every item still need the update to drop the ticket.
+            publish_kitchen_event('order_updated', order_kitchens(order_in_db) | order_kitchens(updated_order), {'order': updated_order})
             logger.info(f"Updated order: {order_id}")
             return jsonify({'success': True, 'message': 'Order updated', 'order': updated_order}), 200
         
@@ -2821,9 +3897,9 @@ def update_active_order(order_id):
 @app.route('/api/activeorders/<order_id>', methods=['DELETE'])
 def delete_order(order_id):
     try:
-        result = activeorders_collection.delete_one({'orderId': order_id})
-        kitchen_result = kitchen_saved_collection.delete_one({'orderId': order_id})
-        if result.deleted_count > 0 or kitchen_result.deleted_count > 0:
+        deleted = activeorders_collection.find_one_and_delete({'orderId': order_id}, projection={'cartItems.requiredKitchens': 1})
+        if deleted:
+            publish_kitchen_event('order_deleted', order_kitchens(deleted), {'orderId': order_id})
             logger.info(f"Deleted order: {order_id}")
             return jsonify({'success': True}), 200
         logger.warning(f"Order not found for deletion: {order_id}")
@@ -2837,6 +3913,9 @@ def delete_order(order_id):
 @app.route('/api/tripreports/<employee_id>', methods=['GET'])
 def get_trip_reports(employee_id):
     try:
+        if request.args.get('format') == 'ndjson':
+            logger.info(f"Streaming trip reports for employee {employee_id} as NDJSON")
+            return ndjson_response(tripreports_collection.find({'deliveryPersonId': employee_id}, {'_id': 0}))
         trip_reports = list(tripreports_collection.find({'deliveryPersonId': employee_id}, {'_id': 0}))
         logger.info(f"Fetched {len(trip_reports)} trip reports for employee: {employee_id}")
         return jsonify(trip_reports), 200
@@ -2883,6 +3962,318 @@ def shutdown():
         logger.error(f"Shutdown error: {str(e)}")
         return jsonify({"message": "Error during shutdown", "error": str(e)}), 500
 
+# Background jobs
+# Outbound SMTP work is persisted in the jobs collection and run by a small pool
+# of worker threads, so request handlers return a job id instead of waiting on
+# the mail server. Jobs left 'running' by a crashed process are re-queued when
+# the workers start, once their lease has expired: another live process may
+# still be sending a job that started recently.
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_MAX_ATTEMPTS = 5
+JOB_BACKOFF_BASE = 10  # seconds; doubles on every failed attempt
+JOB_BACKOFF_MAX = 600
+JOB_POLL_INTERVAL = 5
+JOB_LEASE_TIMEOUT = int(os.getenv('JOB_LEASE_TIMEOUT', 900))  # seconds a running job is assumed alive
+
+SMTP_HOST = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', 587))
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', '1') not in ('0', 'false', 'False')
+SMTP_TIMEOUT = int(os.getenv('SMTP_TIMEOUT', 30))
+SMTP_AUTH_ERROR = "Invalid email or app password. Please check your Email Settings and ensure an App Password is used for Gmail."
+
+job_wakeup = threading.Event()
+job_workers_lock = threading.Lock()
+job_workers = []
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying cannot succeed."""
+
+def open_smtp(email_user, email_pass):
+    """Open an authenticated SMTP session. SMTP_HOST/SMTP_PORT/SMTP_STARTTLS point it at a local server in tests."""
+    server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+    try:
+        if SMTP_STARTTLS:
+            server.starttls()
+        if email_user and email_pass:
+            server.login(email_user, email_pass)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+# SMTP session pool
+# Authenticated sessions are kept per (server, credentials) and reused by the
+# job workers, so a burst of receipts at closing time pays for one connect,
+# STARTTLS and login instead of one per email. Idle sessions are dropped
+# before the server is likely to have timed them out, and a session that was
+# closed underneath us is reopened once before the send is treated as failed.
+SMTP_POOL_IDLE_TIMEOUT = int(os.getenv('SMTP_POOL_IDLE_TIMEOUT', 60))
+SMTP_SESSION_MAX_MESSAGES = 100
+
+smtp_pool_lock = threading.Lock()
+smtp_pool = {}
+
+def smtp_pool_key(email_user, email_pass):
+    return (SMTP_HOST, SMTP_PORT, email_user, hashlib.sha256((email_pass or '').encode()).hexdigest())
+
+def close_smtp_session(session):
+    try:
+        session['server'].quit()
+    except Exception:
+        session['server'].close()
+
+def checkout_smtp_session(email_user, email_pass):
+    """Take an idle session for these credentials from the pool, or open a new one."""
+    key = smtp_pool_key(email_user, email_pass)
+    now = time.monotonic()
+    session = None
+    stale = []
+    with smtp_pool_lock:
+        idle = smtp_pool.get(key, [])
+        while idle:
+            candidate = idle.pop()
+            if now - candidate['last_used'] < SMTP_POOL_IDLE_TIMEOUT:
+                session = candidate
+                break
+            stale.append(candidate)
+    for candidate in stale:
+        close_smtp_session(candidate)
+    if session is None:
+        session = {'key': key, 'server': open_smtp(email_user, email_pass), 'sent': 0, 'last_used': now}
+    return session
+
+def checkin_smtp_session(session):
+    if session['sent'] >= SMTP_SESSION_MAX_MESSAGES:
+        close_smtp_session(session)
+        return
+    session['last_used'] = time.monotonic()
+    with smtp_pool_lock:
+        smtp_pool.setdefault(session['key'], []).append(session)
+
+def prune_smtp_pool():
+    """Close sessions that have sat idle past SMTP_POOL_IDLE_TIMEOUT."""
+    now = time.monotonic()
+    stale = []
+    with smtp_pool_lock:
+        for key, idle in list(smtp_pool.items()):
+            stale.extend(s for s in idle if now - s['last_used'] >= SMTP_POOL_IDLE_TIMEOUT)
+            idle[:] = [s for s in idle if now - s['last_used'] < SMTP_POOL_IDLE_TIMEOUT]
+            if not idle:
+                del smtp_pool[key]
+    for session in stale:
+        close_smtp_session(session)
+
+def reset_smtp_pool():
+    """Close every pooled session, e.g. after the email settings change."""
+    with smtp_pool_lock:
+        sessions = [s for idle in smtp_pool.values() for s in idle]
+        smtp_pool.clear()
+    for session in sessions:
+        close_smtp_session(session)
+
+def send_smtp_message(email_user, email_pass, msg):
+    """Send one message over a pooled session."""
+    session = checkout_smtp_session(email_user, email_pass)
+    try:
+        try:
+            session['server'].send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            if not session['sent']:
+                raise
+            # A reused session was closed by the server; reconnect once
+            logger.info(f"Pooled SMTP session for {email_user} went stale, reconnecting")
+            session['server'].close()
+            session = {'key': session['key'], 'server': open_smtp(email_user, email_pass), 'sent': 0, 'last_used': time.monotonic()}
+            session['server'].send_message(msg)
+    except Exception:
+        close_smtp_session(session)
+        raise
+    session['sent'] += 1
+    checkin_smtp_session(session)
+
+def enqueue_job(job_type, payload, max_attempts=JOB_MAX_ATTEMPTS):
+    """Persist a job and wake a worker. Returns the job id as a string."""
+    now = datetime.now(UTC)
+    result = jobs_collection.insert_one({
+        'type': job_type,
+        'payload': payload,
+        'status': 'queued',
+        'attempts': 0,
+        'max_attempts': max_attempts,
+        'run_after': now,
+        'progress': 'Queued',
+        'result': None,
+        'error': None,
+        'created_at': now,
+        'updated_at': now
+    })
+    start_job_workers()
+    job_wakeup.set()
+    logger.info(f"Queued {job_type} job {result.inserted_id}")
+    return str(result.inserted_id)
+
+def report_job_progress(job_id, progress):
+    jobs_collection.update_one(
+        {'_id': job_id},
+        {'$set': {'progress': progress, 'updated_at': datetime.now(UTC)}}
+    )
+
+def claim_next_job():
+    """Atomically move the oldest due job from queued to running."""
+    now = datetime.now(UTC)
+    return jobs_collection.find_one_and_update(
+        {'status': 'queued', 'run_after': {'$lte': now}},
+        {'$set': {'status': 'running', 'started_at': now, 'updated_at': now}, '$inc': {'attempts': 1}},
+        sort=[('run_after', ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+def run_job(job):
+    handler = JOB_HANDLERS.get(job['type'])
+    try:
+        if handler is None:
+            raise PermanentJobError(f"Unknown job type: {job['type']}")
+        result = handler(job)
+        now = datetime.now(UTC)
+        jobs_collection.update_one(
+            {'_id': job['_id']},
+            {
+                '$set': {'status': 'succeeded', 'progress': 'Done', 'result': result, 'error': None,
+                         'finished_at': now, 'updated_at': now},
+                '$unset': {'payload.password': ''}
+            }
+        )
+        logger.info(f"Job {job['_id']} ({job['type']}) succeeded")
+    except Exception as e:
+        now = datetime.now(UTC)
+        error = SMTP_AUTH_ERROR if isinstance(e, smtplib.SMTPAuthenticationError) else str(e)
+        permanent = isinstance(e, (PermanentJobError, smtplib.SMTPAuthenticationError))
+        if permanent or job['attempts'] >= job['max_attempts']:
+            jobs_collection.update_one(
+                {'_id': job['_id']},
+                {
+                    '$set': {'status': 'failed', 'progress': 'Failed', 'error': error,
+                             'finished_at': now, 'updated_at': now},
+                    '$unset': {'payload.password': ''}
+                }
+            )
+            logger.error(f"Job {job['_id']} ({job['type']}) failed after {job['attempts']} attempt(s): {error}")
+        else:
+            delay = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * 2 ** (job['attempts'] - 1))
+            jobs_collection.update_one(
+                {'_id': job['_id']},
+                {'$set': {'status': 'queued', 'progress': f"Retrying in {delay}s", 'error': error,
+                          'run_after': now + timedelta(seconds=delay), 'updated_at': now}}
+            )
+            logger.warning(f"Job {job['_id']} ({job['type']}) attempt {job['attempts']} failed, retrying in {delay}s: {error}")
+
+def job_worker_loop():
+    while True:
+        try:
+            job = claim_next_job()
+        except Exception as e:
+            logger.error(f"Error claiming job: {str(e)}")
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+        if job is None:
+            prune_smtp_pool()
+            job_wakeup.wait(JOB_POLL_INTERVAL)
+            job_wakeup.clear()
+            continue
+        run_job(job)
+
+def start_job_workers():
+    """Start the worker threads once per process."""
+    with job_workers_lock:
+        if job_workers:
+            return
+        try:
+            now = datetime.now(UTC)
+            requeued = jobs_collection.update_many(
+                {'status': 'running', 'started_at': {'$lt': now - timedelta(seconds=JOB_LEASE_TIMEOUT)}},
+                {'$set': {'status': 'queued', 'run_after': now, 'updated_at': now}}
+            ).modified_count
+            if requeued:
+                logger.info(f"Re-queued {requeued} interrupted job(s)")
+        except Exception as e:
+            logger.error(f"Error re-queueing interrupted jobs: {str(e)}")
+        for n in range(JOB_WORKERS):
+            worker = threading.Thread(target=job_worker_loop, name=f'job-worker-{n}', daemon=True)
+            worker.start()
+            job_workers.append(worker)
+        logger.info(f"Started {JOB_WORKERS} job worker(s)")
+
+def build_email_message(from_email, to_email, subject, html=None, text=None, attachment_path=None):
+    msg = MIMEMultipart('mixed' if attachment_path else 'alternative')
+    msg['From'] = from_email
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    if text:
+        msg.attach(MIMEText(text, 'plain'))
+    if html:
+        msg.attach(MIMEText(html, 'html'))
+    if attachment_path:
+        if not os.path.exists(attachment_path):
+            raise PermanentJobError(f"Attachment no longer exists: {os.path.basename(attachment_path)}")
+        with open(attachment_path, 'rb') as f:
+            attachment = MIMEBase('application', 'octet-stream')
+            attachment.set_payload(f.read())
+        encoders.encode_base64(attachment)
+        attachment.add_header('Content-Disposition', f'attachment; filename={os.path.basename(attachment_path)}')
+        msg.attach(attachment)
+    return msg
+
+def send_email_job(job):
+    """Send one message with the stored email settings. A missing 'to' sends to the configured account."""
+    payload = job['payload']
+    settings = email_settings_collection.find_one()
+    if not settings:
+        raise PermanentJobError("Email settings not configured. Please configure in Email Settings.")
+    email_user = settings.get('email')
+    to_email = payload.get('to') or email_user
+    msg = build_email_message(
+        settings.get('from_email') or email_user,
+        to_email,
+        payload['subject'],
+        html=payload.get('html'),
+        text=payload.get('text'),
+        attachment_path=payload.get('attachment_path')
+    )
+    report_job_progress(job['_id'], 'Sending')
+    send_smtp_message(email_user, settings.get('password'), msg)
+    logger.info(f"Email sent successfully to {to_email}")
+    return {'to': to_email}
+
+def test_email_settings_job(job):
+    payload = job['payload']
+    report_job_progress(job['_id'], 'Connecting to SMTP server')
+    with open_smtp(payload['email'], payload['password']):
+        pass
+    logger.info(f"SMTP authentication successful for {payload['email']}")
+    return {'message': 'Email settings are valid'}
+
+JOB_HANDLERS = {
+    'send_email': send_email_job,
+    'test_email_settings': test_email_settings_job,
+}
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        if not ObjectId.is_valid(job_id):
+            return jsonify({"error": "Invalid job ID"}), 400
+        job = jobs_collection.find_one({'_id': ObjectId(job_id)}, {'payload': 0})
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        job['_id'] = str(job['_id'])
+        for field in ('run_after', 'created_at', 'updated_at', 'started_at', 'finished_at'):
+            if isinstance(job.get(field), datetime):
+                job[field] = job[field].isoformat()
+        return jsonify(job), 200
+    except Exception as e:
+        logger.error(f"Error fetching job {job_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/save-email-settings', methods=['POST'])
 def save_email_settings():
     """Save email settings to MongoDB."""
@@ -2908,6 +4299,7 @@ def save_email_settings():
             },
             upsert=True
         )
+        reset_smtp_pool()
         logger.info(f"Email settings saved for {email}")
         return jsonify({"success": True, "message": "Email settings saved successfully"}), 200
     except Exception as e:
@@ -2928,7 +4320,7 @@ def get_email_settings():
 
 @app.route('/api/test-email-settings', methods=['POST'])
 def test_email_settings():
-    """Test email settings by attempting to authenticate with SMTP."""
+    """Queue an SMTP login test; poll /api/jobs/<job_id> for the result."""
     try:
         data = request.get_json()
         email = data.get('email')
@@ -2936,25 +4328,15 @@ def test_email_settings():
         if not all([email, password]):
             return jsonify({"success": False, "error": "Missing required fields: email, password"}), 400
 
-        # Attempt SMTP login
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:
-            server.starttls()
-            server.login(email, password)
-        logger.info(f"SMTP authentication successful for {email}")
-        return jsonify({"success": True, "message": "Email settings are valid"}), 200
-    except smtplib.SMTPAuthenticationError as e:
-        logger.error(f"SMTP Authentication Error during test: {str(e)}")
-        return jsonify({"success": False, "error": "Invalid email or app password. Please check your credentials and ensure an App Password is used for Gmail."}), 401
-    except smtplib.SMTPException as e:
-        logger.error(f"SMTP Error during test: {str(e)}")
-        return jsonify({"success": False, "error": f"SMTP error: {str(e)}"}), 500
+        job_id = enqueue_job('test_email_settings', {'email': email, 'password': password}, max_attempts=1)
+        return jsonify({"success": True, "message": "Testing email settings", "job_id": job_id}), 202
     except Exception as e:
         logger.error(f"Unexpected error testing email settings: {str(e)}")
         return jsonify({"success": False, "error": f"Failed to test email settings: {str(e)}"}), 500
 
 @app.route('/api/send-email', methods=['POST', 'OPTIONS'])
 def send_email():
-    """Send an email with HTML content."""
+    """Queue an email with HTML content."""
     if request.method == 'OPTIONS':
         response = jsonify({"success": True})
         response.headers['Access-Control-Allow-Origin'] = '*'
@@ -2979,72 +4361,171 @@ def send_email():
         if not settings:
             logger.error("No email settings configured")
             return jsonify({"success": False, "message": "Email settings not configured. Please configure in Email Settings."}), 500
-        email_user = settings.get('email')
-        email_pass = settings.get('password')
-        from_email = settings.get('from_email')
-
-        msg = MIMEMultipart('alternative')
-        msg['From'] = from_email
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(html_content, 'html'))
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:
-            server.starttls()
-            server.login(email_user, email_pass)
-            server.send_message(msg)
-            logger.info(f"Email sent successfully to {to_email}")
-        return jsonify({"success": True, "message": "Email sent successfully"}), 200
-    except smtplib.SMTPAuthenticationError as e:
-        logger.error(f"SMTP Authentication Error: {str(e)}")
-        return jsonify({"success": False, "message": "Invalid email or app password. Please check your Email Settings and ensure an App Password is used for Gmail."}), 401
-    except smtplib.SMTPException as e:
-        logger.error(f"SMTP Error: {str(e)}")
-        return jsonify({"success": False, "message": f"SMTP error: {str(e)}"}), 500
-    except Exception as e:
-        logger.error(f"Unexpected error sending email: {str(e)}")
+
+        job_id = enqueue_job('send_email', {'to': to_email, 'subject': subject, 'html': html_content})
+        return jsonify({"success": True, "message": "Email queued for delivery", "job_id": job_id}), 202
+    except Exception as e:
+        logger.error(f"Unexpected error queueing email: {str(e)}")
         return jsonify({"success": False, "message": f"Failed to send email: {str(e)}"}), 500
 
+# Data export
+# One pipeline serves the Excel download, NDJSON export and the scheduled
+# backup: a single batched cursor scan per collection feeds every writer. Excel
+# sheets need their header row first, so when no columns are requested the
+# Excel writer collects the union of top-level fields during the scan, spooling
+# rows to a temp file, and writes the sheet from the spool once the scan ends.
+EXCEL_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+EXPORT_BATCH_SIZE = 500
+EXPORT_COLLECTIONS = {
+    'customers': customers_collection,
+    'items': items_collection,
+    'sales': sales_collection,
+    'tables': tables_collection,
+    'users': users_collection,
+    'picked_up_items': picked_up_collection,
+    'pos_opening_entries': opening_collection,
+    'pos_closing_entries': pos_closing_collection,
+    'system_settings': settings_collection,
+    'kitchens': kitchens_collection,
+    'item_groups': item_groups_collection
+}
+
+def excel_cell(value):
+    return str(value) if isinstance(value, (ObjectId, list, dict)) else value
+
+class ExcelExportWriter:
+    """One write-only sheet per collection; saved to target on close.
+
+    begin() with headers=None takes the columns from the documents themselves,
+    in order of first appearance.
+    """
+    def __init__(self, target):
+        self.target = target
+        self.wb = openpyxl.Workbook(write_only=True)
+        self.ws = None
+        self.spool = None
+
+    def _finish_sheet(self):
+        if self.spool is None:
+            return
+        self.headers = list(self.fields)
+        self.ws.append(self.headers or ['No data'])
+        self.spool.seek(0)
+        for doc in bson.decode_file_iter(self.spool):
+            self._append_row(doc)
+        self.spool.close()
+        self.spool = None
+
+    def _append_row(self, doc):
+        self.ws.append([excel_cell(doc.get(header, '')) for header in self.headers])
+
+    def begin(self, collection_name, headers):
+        self._finish_sheet()
+        self.ws = self.wb.create_sheet(title=collection_name)
+        self.headers = headers
+        if headers:
+            self.ws.append(headers)
+        else:
+            self.fields = {}
+            self.spool = tempfile.TemporaryFile()
+
+    def write(self, doc):
+        if self.spool is None:
+            self._append_row(doc)
+            return
+        for field in doc:
+            self.fields.setdefault(field, None)
+        self.spool.write(bson.encode(doc))
+
+    def close(self):
+        self._finish_sheet()
+        self.wb.save(self.target)
+
+class NdjsonExportWriter:
+    """One JSON line per document, tagged with its collection name."""
+    def __init__(self, stream):
+        self.stream = stream
+
+    def begin(self, collection_name, headers):
+        self.collection_name = collection_name
+
+    def write(self, doc):
+        line = json.dumps({'collection': self.collection_name, 'document': doc}, default=json_default)
+        self.stream.write((line + '\n').encode('utf-8'))
+
+    def close(self):
+        self.stream.flush()
+
+def parse_export_fields(value):
+    """Parse ?fields=sales.invoice_no,sales.date into {'sales': ['invoice_no', 'date']}."""
+    fields = {}
+    for entry in (value or '').split(','):
+        collection_name, _, field = entry.strip().partition('.')
+        if collection_name and field:
+            fields.setdefault(collection_name, []).append(field)
+    return fields
+
+def run_export(writers, collections=None, fields=None, queries=None):
+    """Scan each collection once and feed every document to every writer.
+
+    fields maps a collection name to the columns to export; other collections
+    are begun with headers=None and get their full union schema from the
+    writers. queries optionally filters a collection. Returns the document
+    count per collection.
+    """
+    fields = fields or {}
+    queries = queries or {}
+    counts = {}
+    for collection_name, collection in (collections or EXPORT_COLLECTIONS).items():
+        query = queries.get(collection_name, {})
+        headers = fields.get(collection_name)
+        projection = None
+        if headers:
+            projection = {field: 1 for field in headers}
+            if '_id' not in headers:
+                projection['_id'] = 0
+        for writer in writers:
+            writer.begin(collection_name, headers)
+        count = 0
+        for doc in collection.find(query, projection).batch_size(EXPORT_BATCH_SIZE):
+            for writer in writers:
+                writer.write(doc)
+            count += 1
+        counts[collection_name] = count
+    for writer in writers:
+        writer.close()
+    return counts
+
 @app.route('/api/export-all-to-excel', methods=['GET'])
 def export_all_to_excel():
-    """Export all data to an Excel file."""
-    try:
-        wb = openpyxl.Workbook()
-        wb.remove(wb.active)
-        collections = {
-            'customers': customers_collection,
-            'items': items_collection,
-            'sales': sales_collection,
-            'tables': tables_collection,
-            'users': users_collection,
-            'picked_up_items': picked_up_collection,
-            'pos_opening_entries': opening_collection,
-            'pos_closing_entries': pos_closing_collection,
-            'system_settings': settings_collection,
-            'kitchens': kitchens_collection,
-            'item_groups': item_groups_collection
-        }
-        for collection_name, collection in collections.items():
-            ws = wb.create_sheet(title=collection_name)
-            data = list(collection.find())
-            if not data:
-                ws.append(['No data'])
-                continue
-            sample_doc = data[0]
-            headers = list(sample_doc.keys())
-            ws.append(headers)
-            for doc in data:
-                row = [str(doc.get(header, '')) if isinstance(doc.get(header), (ObjectId, list, dict)) else doc.get(header, '') for header in headers]
-                ws.append(row)
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
-        filename = f'restaurant_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-        logger.info(f"Exported data to Excel: {filename}")
-        return Response(
-            buffer.getvalue(),
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={'Content-Disposition': f'attachment; filename={filename}'}
-        )
+    """Export all data to an Excel file, or NDJSON with ?format=ndjson."""
+    try:
+        export_format = request.args.get('format', 'xlsx')
+        if export_format not in ('xlsx', 'ndjson'):
+            return jsonify({"error": "format must be xlsx or ndjson"}), 400
+        collections = EXPORT_COLLECTIONS
+        if request.args.get('collections'):
+            names = [name.strip() for name in request.args['collections'].split(',') if name.strip()]
+            unknown = [name for name in names if name not in EXPORT_COLLECTIONS]
+            if unknown:
+                return jsonify({"error": f"Unknown collections: {', '.join(unknown)}"}), 400
+            collections = {name: EXPORT_COLLECTIONS[name] for name in names}
+        fields = parse_export_fields(request.args.get('fields'))
+
+        # xlsx is a zip container and needs a seekable target; the anonymous
+        # temp file is streamed out by send_file and removed when the response closes.
+        export_file = tempfile.TemporaryFile()
+        try:
+            writer = ExcelExportWriter(export_file) if export_format == 'xlsx' else NdjsonExportWriter(export_file)
+            counts = run_export([writer], collections, fields)
+        except Exception:
+            export_file.close()
+            raise
+        export_file.seek(0)
+        filename = f'restaurant_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{export_format}'
+        logger.info(f"Exported {sum(counts.values())} documents to {filename}")
+        mimetype = EXCEL_MIMETYPE if export_format == 'xlsx' else 'application/x-ndjson'
+        return send_file(export_file, mimetype=mimetype, as_attachment=True, download_name=filename)
     except Exception as e:
         logger.error(f"Error exporting to Excel: {str(e)}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
@@ -3064,80 +4545,258 @@ def manage_backup_limit():
     except Exception as e:
         logger.error(f"Error managing backup limit: {str(e)}")
 
-def create_backup():
-    """Create a backup and send it via email using settings from MongoDB."""
-    try:
-        wb = openpyxl.Workbook()
-        wb.remove(wb.active)
-        collections = {
-            'customers': customers_collection,
-            'items': items_collection,
-            'sales': sales_collection,
-            'tables': tables_collection,
-            'users': users_collection,
-            'picked_up_items': picked_up_collection,
-            'pos_opening_entries': opening_collection,
-            'pos_closing_entries': pos_closing_collection,
-            'system_settings': settings_collection,
-            'kitchens': kitchens_collection,
-            'item_groups': item_groups_collection
-        }
-        for collection_name, collection in collections.items():
-            ws = wb.create_sheet(title=collection_name)
-            data = list(collection.find())
-            if not data:
-                ws.append(['No data'])
-                continue
-            sample_doc = data[0]
-            headers = list(sample_doc.keys())
-            ws.append(headers)
-            for doc in data:
-                row = [str(doc.get(header, '')) if isinstance(doc.get(header), (ObjectId, list, dict)) else doc.get(header, '') for header in headers]
-                ws.append(row)
-        buffer = BytesIO()
-        wb.save(buffer)
-        buffer.seek(0)
+# Archive backups
+# The primary backup is a directory of gzip-compressed BSON files, one per
+# collection in mongodump's <collection>.bson.gz layout, with a manifest.json
+# holding the document count and SHA-256 of each collection's BSON stream.
+# Documents keep their native types, unlike the Excel report written alongside.
+#
+# The scheduled backup writes a full snapshot every BACKUP_FULL_INTERVAL and
+# otherwise only the documents inserted (ObjectId time) or stamped with
+# modified_at/updated_at since that collection's mark in backup_state.
+# restore_backup_chain replays the newest full snapshot plus the deltas taken
+# after it. Deletes are not visible to a delta; the next full snapshot
+# reconciles them.
+BACKUP_CHAIN_FOLDER = create_directory(os.path.join(app.config['UPLOAD_FOLDER'], 'backup_chain'))
+BACKUP_FULL_INTERVAL = timedelta(days=int(os.getenv('BACKUP_FULL_INTERVAL_DAYS', 7)))
+BACKUP_CHAINS_KEPT = 2
+BACKUP_RESTORE_BATCH_SIZE = 500
+BACKUP_GZIP_LEVEL = 6
+BACKUP_ARCHIVE_FORMAT = 1
+BACKUP_CHANGE_FIELDS = ('modified_at', 'updated_at')
+# Some routes stamp naive local-time ISO strings, so the delta window is widened
+# by the largest UTC offset. Replaying a document twice is harmless.
+BACKUP_DELTA_OVERLAP = timedelta(hours=14)
+
+def as_utc(value):
+    """Treat naive datetimes (as pymongo returns them) as UTC."""
+    return value.replace(tzinfo=UTC) if value.tzinfo is None else value
+
+def backup_delta_query(since):
+    since = as_utc(since) - BACKUP_DELTA_OVERLAP
+    clauses = [{'_id': {'$gte': ObjectId.from_datetime(since)}}]
+    for field in BACKUP_CHANGE_FIELDS:
+        clauses.append({field: {'$gte': since}})
+        clauses.append({field: {'$gte': since.strftime('%Y-%m-%dT%H:%M:%S')}})
+    return {'$or': clauses}
+
+class BackupArchiveWriter:
+    """Stream each collection to <directory>/<collection>.bson.gz and write the manifest on close.
+
+    begin() records each collection's high-water mark just before its scan starts.
+    """
+    def __init__(self, directory, header):
+        os.makedirs(directory)
+        self.directory = directory
+        self.manifest = dict(header, format=BACKUP_ARCHIVE_FORMAT, collections={})
+        self.marks = {}
+        self.stream = None
+
+    def _finish_collection(self):
+        if self.stream is None:
+            return
+        self.stream.close()
+        self.stream = None
+        entry = self.manifest['collections'][self.collection_name]
+        entry['sha256'] = self.digest.hexdigest()
+        entry['compressed_bytes'] = os.path.getsize(os.path.join(self.directory, entry['file']))
+
+    def begin(self, collection_name, headers):
+        self._finish_collection()
+        self.collection_name = collection_name
+        self.marks[collection_name] = datetime.now(UTC)
+        filename = f'{collection_name}.bson.gz'
+        self.manifest['collections'][collection_name] = {'file': filename, 'count': 0}
+        self.stream = gzip.open(os.path.join(self.directory, filename), 'wb', compresslevel=BACKUP_GZIP_LEVEL)
+        self.digest = hashlib.sha256()
+
+    def write(self, doc):
+        data = bson.encode(doc)
+        self.digest.update(data)
+        self.stream.write(data)
+        self.manifest['collections'][self.collection_name]['count'] += 1
+
+    def close(self):
+        self._finish_collection()
+        with open(os.path.join(self.directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+            f.write(json_util.dumps(self.manifest, json_options=json_util.RELAXED_JSON_OPTIONS, indent=2))
+
+    def abort(self):
+        if self.stream is not None:
+            self.stream.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+def read_backup_manifest(directory):
+    with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json_util.loads(f.read())
+    manifest['created_at'] = as_utc(manifest['created_at'])
+    return manifest
+
+def list_backup_archives():
+    """(manifest, directory) for every complete archive, oldest first."""
+    entries = []
+    for name in os.listdir(BACKUP_CHAIN_FOLDER):
+        directory = os.path.join(BACKUP_CHAIN_FOLDER, name)
+        if name.endswith('.partial') or not os.path.exists(os.path.join(directory, 'manifest.json')):
+            continue
+        try:
+            entries.append((read_backup_manifest(directory), directory))
+        except Exception as e:
+            logger.error(f"Skipping unreadable backup archive {name}: {str(e)}")
+    entries.sort(key=lambda entry: entry[0]['created_at'])
+    return entries
+
+def prune_backup_chain():
+    """Keep the newest BACKUP_CHAINS_KEPT full snapshots and the deltas that depend on them."""
+    try:
+        entries = list_backup_archives()
+        fulls = [index for index, (manifest, _) in enumerate(entries) if manifest['kind'] == 'full']
+        if len(fulls) <= BACKUP_CHAINS_KEPT:
+            return
+        for manifest, directory in entries[:fulls[-BACKUP_CHAINS_KEPT]]:
+            shutil.rmtree(directory)
+            logger.info(f"Deleted old backup archive: {os.path.basename(directory)}")
+    except Exception as e:
+        logger.error(f"Error pruning backup chain: {str(e)}")
+
+def iter_archive_collection(directory, entry):
+    """Yield the raw BSON of each document in one <collection>.bson.gz file."""
+    with gzip.open(os.path.join(directory, entry['file']), 'rb') as f:
+        while True:
+            size_bytes = f.read(4)
+            if not size_bytes:
+                return
+            yield size_bytes + f.read(int.from_bytes(size_bytes, 'little') - 4)
+
+def verify_backup_archive(directory, manifest):
+    """Raise ValueError unless every collection file matches its manifest count and checksum."""
+    for collection_name, entry in manifest['collections'].items():
+        digest = hashlib.sha256()
+        count = 0
+        for data in iter_archive_collection(directory, entry):
+            digest.update(data)
+            count += 1
+        if digest.hexdigest() != entry['sha256'] or count != entry['count']:
+            raise ValueError(f"Backup archive {os.path.basename(directory)} is corrupt: {collection_name} does not match its manifest")
+
+def resolve_backup_chain(until=None, name=None):
+    """The archives to replay: the chosen full snapshot followed by its deltas."""
+    entries = list_backup_archives()
+    if name:
+        names = [os.path.basename(directory) for _, directory in entries]
+        if name not in names:
+            raise ValueError(f"Backup archive not found: {name}")
+        entries = entries[:names.index(name) + 1]
+    if until is not None:
+        entries = [entry for entry in entries if entry[0]['created_at'] <= as_utc(until)]
+    fulls = [index for index, (manifest, _) in enumerate(entries) if manifest['kind'] == 'full']
+    if not fulls:
+        raise ValueError("No full backup snapshot to restore from")
+    base_manifest, base_directory = entries[fulls[-1]]
+    base_name = os.path.basename(base_directory)
+    return [(base_manifest, base_directory)] + [
+        (manifest, directory) for manifest, directory in entries[fulls[-1] + 1:]
+        if manifest['kind'] == 'delta' and manifest.get('base') == base_name
+    ]
+
+def restore_backup_chain(until=None, name=None):
+    """Replay the newest full snapshot taken at or before until (or up to the archive name), then its deltas.
+
+    Every archive is verified before anything is written. Collections in the
+    full snapshot are emptied first; deltas upsert by _id. Returns the number
+    of documents written per collection.
+    """
+    chain = resolve_backup_chain(until, name)
+    for manifest, directory in chain:
+        verify_backup_archive(directory, manifest)
+    counts = {}
+    for manifest, directory in chain:
+        for collection_name, entry in manifest['collections'].items():
+            collection = db[collection_name]
+            if manifest['kind'] == 'full':
+                collection.delete_many({})
+            batch = []
+            for data in iter_archive_collection(directory, entry):
+                doc = bson.decode(data)
+                batch.append(ReplaceOne({'_id': doc['_id']}, doc, upsert=True))
+                if len(batch) >= BACKUP_RESTORE_BATCH_SIZE:
+                    collection.bulk_write(batch, ordered=False)
+                    batch = []
+            if batch:
+                collection.bulk_write(batch, ordered=False)
+            counts[collection_name] = counts.get(collection_name, 0) + entry['count']
+        logger.info(f"Replayed {manifest['kind']} backup {os.path.basename(directory)}")
+    if 'sales' in counts:
+        logger.info("Sales restored; POST /api/sales-summary/rebuild to refresh the daily summaries")
+    reset_offer_timeline()
+    invalidate_menu_snapshot()
+    for catalog_name in catalog_versions:
+        bump_catalog_version(catalog_name)
+    return counts
+
+def create_backup(full=None):
+    """Write a backup archive plus its Excel report and queue the report for email delivery.
+
+    With full=None the chain decides: a full snapshot when there is no usable
+    base or the last one is older than BACKUP_FULL_INTERVAL, otherwise a delta.
+    """
+    archive_writer = None
+    try:
+        started = datetime.now(UTC)
+        state = backup_state_collection.find_one({'_id': 'chain'}) or {}
+        base_name = state.get('full_file')
+        has_base = bool(base_name) and os.path.exists(os.path.join(BACKUP_CHAIN_FOLDER, base_name, 'manifest.json'))
+        if full is None:
+            full = not has_base or started - as_utc(state['full_at']) >= BACKUP_FULL_INTERVAL
+        elif not full and not has_base:
+            full = True
+        marks = state.get('marks', {}) if not full else {}
+        queries = {name: backup_delta_query(marks[name]) for name in EXPORT_COLLECTIONS if name in marks}
+
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f'backup_restaurant_data_{timestamp}.xlsx'
+        kind = 'data' if full else 'delta'
+        filename = f'backup_restaurant_{kind}_{timestamp}.xlsx'
+        archive_name = f'backup_restaurant_{kind}_{timestamp}'
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        with open(file_path, 'wb') as f:
-            f.write(buffer.getvalue())
+        archive_path = os.path.join(BACKUP_CHAIN_FOLDER, archive_name)
+        # Write under temporary names so listings never see a half-written backup
+        partial_path = file_path + '.partial'
+        try:
+            archive_writer = BackupArchiveWriter(archive_path + '.partial', {
+                'kind': 'full' if full else 'delta',
+                'created_at': started,
+                'base': None if full else base_name,
+                'since': marks
+            })
+            counts = run_export([archive_writer, ExcelExportWriter(partial_path)], queries=queries)
+            os.replace(archive_path + '.partial', archive_path)
+            os.replace(partial_path, file_path)
+        except Exception:
+            if archive_writer:
+                archive_writer.abort()
+            raise
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+        update = {'marks': archive_writer.marks, 'last_file': archive_name, 'last_at': started}
+        if full:
+            update.update({'full_file': archive_name, 'full_at': started})
+        backup_state_collection.update_one({'_id': 'chain'}, {'$set': update}, upsert=True)
         manage_backup_limit()
-
-        # Fetch email settings
-        settings = email_settings_collection.find_one()
-        if not settings:
-            logger.error("No email settings configured")
-            return False, "Email settings not configured. Please configure in Email Settings."
-        email_user = settings.get('email')
-        email_pass = settings.get('password')
-        from_email = settings.get('from_email')
-
-        # Send email with backup attachment
-        msg = MIMEMultipart()
-        msg['From'] = from_email
-        msg['To'] = email_user
-        msg['Subject'] = f'Restaurant Data Backup - {timestamp}'
-        body = f'Backup of restaurant data generated on {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}.'
-        msg.attach(MIMEText(body, 'plain'))
-        with open(file_path, 'rb') as f:
-            attachment = MIMEBase('application', 'octet-stream')
-            attachment.set_payload(f.read())
-            encoders.encode_base64(attachment)
-            attachment.add_header('Content-Disposition', f'attachment; filename={filename}')
-            msg.attach(attachment)
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:
-            server.starttls()
-            server.login(email_user, email_pass)
-            server.send_message(msg)
-        logger.info(f"Backup created and emailed: {filename}")
+        prune_backup_chain()
+
+        # The download must not wait on SMTP; a job worker delivers the email
+        if email_settings_collection.find_one():
+            enqueue_job('send_email', {
+                'subject': f'Restaurant Data Backup{"" if full else " (changes)"} - {timestamp}',
+                'text': f'{"Backup" if full else "Changes since the previous backup"} of restaurant data generated on {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}.',
+                'attachment_path': file_path
+            })
+        else:
+            logger.warning("No email settings configured; backup will not be emailed")
+        logger.info(f"Backup created: {archive_name} ({sum(counts.values())} documents)")
         return True, f"Backup created successfully: {filename}"
-    except smtplib.SMTPAuthenticationError as e:
-        logger.error(f"SMTP Authentication Error: {str(e)}")
-        return False, f"Invalid email or app password. Please check your Email Settings and ensure an App Password is used for Gmail."
-    except smtplib.SMTPException as e:
-        logger.error(f"SMTP Error: {str(e)}")
-        return False, f"SMTP error: {str(e)}"
     except Exception as e:
         logger.error(f"Error in backup: {str(e)}")
         return False, str(e)
@@ -3146,22 +4805,52 @@ def create_backup():
 def backup_to_excel():
     """Create a backup and serve it as a download."""
     try:
-        success, message = create_backup()
+        success, message = create_backup(full=True)
         if not success:
             return jsonify({"error": message}), 500
         filename = message.split(': ')[1]
         file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        with open(file_path, 'rb') as f:
-            file_data = f.read()
-        return Response(
-            file_data,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            headers={'Content-Disposition': f'attachment; filename={filename}'}
-        )
+        return send_file(file_path, mimetype=EXCEL_MIMETYPE, as_attachment=True, download_name=filename)
     except Exception as e:
         logger.error(f"Error serving backup file: {str(e)}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+@app.route('/api/backup-archives', methods=['GET'])
+def get_backup_archives():
+    """List backup archives with their manifests, newest first."""
+    try:
+        archives = []
+        for manifest, directory in reversed(list_backup_archives()):
+            archives.append({
+                'name': os.path.basename(directory),
+                'kind': manifest['kind'],
+                'base': manifest.get('base'),
+                'created_at': manifest['created_at'].isoformat(),
+                'collections': {name: {'count': entry['count'], 'compressed_bytes': entry['compressed_bytes']}
+                                for name, entry in manifest['collections'].items()}
+            })
+        return jsonify(archives), 200
+    except Exception as e:
+        logger.error(f"Error listing backup archives: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/restore-backup', methods=['POST'])
+def restore_backup():
+    """Restore from the backup archives. Body: {"name": archive} or {"until": ISO timestamp}; default is the latest."""
+    try:
+        data = request.get_json(silent=True) or {}
+        until = datetime.fromisoformat(data['until']) if data.get('until') else None
+        started = time.monotonic()
+        counts = restore_backup_chain(until=until, name=data.get('name'))
+        elapsed = time.monotonic() - started
+        logger.info(f"Restored {sum(counts.values())} documents in {elapsed:.1f}s")
+        return jsonify({"message": "Backup restored", "restored": counts, "seconds": round(elapsed, 2)}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error restoring backup: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/backup-info', methods=['GET'])
 def backup_info():
     """Retrieve information about existing backups."""
@@ -3205,50 +4894,22 @@ def download_backup():
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
 def manage_offers():
-    """Check all items and update offer status based on current time."""
+    """Unset offer fields on items whose offer window has ended or is invalid."""
     try:
-        current_time = datetime.now(UTC)
-        items = items_collection.find({
-            '$or': [
-                {'offer_start_time': {'$exists': True}},
-                {'offer_end_time': {'$exists': True}}
-            ]
-        })
-        for item in items:
-            item_id = item['_id']
-            offer_start_time = item.get('offer_start_time')
-            offer_end_time = item.get('offer_end_time')
-            should_unset = False
-            if offer_start_time and offer_end_time:
-                try:
-                    start_time = datetime.fromisoformat(str(offer_start_time).replace('Z', '+00:00'))
-                    end_time = datetime.fromisoformat(str(offer_end_time).replace('Z', '+00:00'))
-                    if current_time > end_time:
-                        should_unset = True
-                        logger.info(f"Offer expired for item {item.get('item_name')} (ID: {item_id})")
-                    elif start_time > end_time:
-                        should_unset = True
-                        logger.warning(f"Invalid offer times for item {item_id}: start_time after end_time")
-                    else:
-                        logger.debug(f"Offer for item {item.get('item_name')} (ID: {item_id}) is active or pending")
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"Invalid offer time format for item {item_id}: {str(e)}")
-                    should_unset = True
-            elif offer_end_time:
-                try:
-                    end_time = datetime.fromisoformat(str(offer_end_time).replace('Z', '+00:00'))
-                    if current_time > end_time:
-                        should_unset = True
-                        logger.info(f"Offer expired for item {item.get('item_name')} (ID: {item_id})")
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"Invalid offer_end_time for item {item_id}: {str(e)}")
-                    should_unset = True
-            if should_unset:
-                items_collection.update_one(
-                    {'_id': item_id},
-                    {'$unset': {'offer_price': "", 'offer_start_time': "", 'offer_end_time': ""}}
-                )
-                logger.info(f"Unset offer fields for item {item.get('item_name')} (ID: {item_id})")
+        with offer_timeline_lock:
+            _advance_offer_timeline(datetime.now(UTC))
+            expired = offer_timeline['expired']
+            offer_timeline['expired'] = {}
+        for item_id, offer_end_time in expired.items():
+            # Match on the old end time so an offer set in the meantime is kept.
+            result = items_collection.update_one(
+                {'_id': ObjectId(item_id), 'offer_end_time': offer_end_time},
+                {'$unset': {'offer_price': "", 'offer_start_time': "", 'offer_end_time': ""}}
+            )
+            if result.modified_count:
+                logger.info(f"Unset offer fields for item {item_id}")
+        if expired:
+            invalidate_menu_snapshot()
     except Exception as e:
         logger.error(f"Error in manage_offers: {str(e)}")
 
@@ -3615,16 +5276,93 @@ def serve_frontend(path):
     logger.warning(f"Frontend file not found: {path}")
     return jsonify({"error": "Frontend not found"}), 404
 
+# Production server configuration
+# Waitress settings come from defaults, then the system settings document, then
+# environment variables, so a site can size the pool for its number of terminals.
+# 'threads' counts request threads; KITCHEN_STREAM_MAX_SUBSCRIBERS more are added
+# for kitchen event streams, which hold a thread for as long as they are open.
+SERVER_CONFIG_DEFAULTS = {
+    'threads': 8,
+    'connection_limit': 100,
+    'channel_timeout': 120,
+    'backlog': 1024
+}
+SERVER_CONFIG_SOURCES = {
+    # waitress option: (system_settings key, environment variable)
+    'threads': ('serverThreads', 'WAITRESS_THREADS'),
+    'connection_limit': ('serverConnectionLimit', 'WAITRESS_CONNECTION_LIMIT'),
+    'channel_timeout': ('serverChannelTimeout', 'WAITRESS_CHANNEL_TIMEOUT'),
+    'backlog': ('serverBacklog', 'WAITRESS_BACKLOG')
+}
+waitress_server = None
+
+def get_server_config():
+    config = dict(SERVER_CONFIG_DEFAULTS)
+    try:
+        settings = get_system_settings()
+    except Exception as e:
+        logger.warning(f"Could not read server settings from MongoDB: {str(e)}")
+        settings = {}
+    for option, (settings_key, env_var) in SERVER_CONFIG_SOURCES.items():
+        value = os.getenv(env_var, settings.get(settings_key))
+        if value in (None, ''):
+            continue
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            logger.warning(f"Ignoring invalid {option} value: {value}")
+            continue
+        if value > 0:
+            config[option] = value
+    config['threads'] += KITCHEN_STREAM_MAX_SUBSCRIBERS
+    return config
+
+@app.route('/api/admin/server-metrics', methods=['GET'])
+def get_server_metrics():
+    """Report the Waitress pool size, busy workers, queued requests, open kitchen streams and password hashing stats."""
+    try:
+        dispatcher = getattr(waitress_server, 'task_dispatcher', None)
+        if dispatcher is None:
+            return jsonify({"server": "development", "message": "Metrics are only available under Waitress",
+                            "kitchen_streams": kitchen_stream_metrics(),
+                            "password_hashing": password_hash_metrics()}), 200
+        socket_map = getattr(waitress_server, '_map', None) or getattr(waitress_server, 'map', {})
+        return jsonify({
+            "server": "waitress",
+            "config": {option: getattr(waitress_server.adj, option) for option in SERVER_CONFIG_DEFAULTS},
+            "threads": len(dispatcher.threads),
+            "active_tasks": dispatcher.active_count,
+            "queued_tasks": len(dispatcher.queue),
+            "open_connections": sum(1 for channel in list(socket_map.values()) if isinstance(channel, HTTPChannel)),
+            "kitchen_streams": kitchen_stream_metrics(),
+            "password_hashing": password_hash_metrics()
+        }), 200
+    except Exception as e:
+        logger.error(f"Error fetching server metrics: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 # Start the server
 def start_scheduler():
     pass  # Add your scheduler logic here if required
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'restore-backup':
+        # python app.py restore-backup [ISO timestamp]
+        until = datetime.fromisoformat(sys.argv[2]) if len(sys.argv) > 2 else None
+        for collection_name, count in restore_backup_chain(until).items():
+            print(f"{collection_name}: {count} documents restored")
+        sys.exit(0)
     start_scheduler()  # Start the backup scheduler
     # Use Waitress for production, Flask's built-in server for development
     if getattr(sys, 'frozen', False):
-        logger.info("Running as frozen executable, using Waitress")
-        waitress.serve(app, host='0.0.0.0', port=5000, threads=1, _quiet=True)
+        start_job_workers()
+        server_config = get_server_config()
+        logger.info(f"Running as frozen executable, using Waitress with {server_config}")
+        waitress_server = waitress.create_server(app, host='0.0.0.0', port=5000, _quiet=True, **server_config)
+        waitress_server.run()
     else:
         logger.info("Running in development mode, using Flask")
+        # The reloader parent only watches files; workers run in the serving child.
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_job_workers()
         app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
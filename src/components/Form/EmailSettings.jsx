@@ -38,6 +38,18 @@ function EmailSettings() {
     return emailRegex.test(email);
   };
 
+  // The SMTP test runs as a background job; poll until it finishes.
+  const waitForJob = async (jobId) => {
+    for (let attempt = 0; attempt < 60; attempt += 1) {
+      const { data } = await axios.get(`http://localhost:5000/api/jobs/${jobId}`);
+      if (data.status === 'succeeded' || data.status === 'failed') {
+        return data;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+    return { status: 'failed', error: 'Timed out waiting for the email settings test' };
+  };
+
   const handleTestSettings = async () => {
     if (!email || !password) {
       setMessage('Please provide email and app password to test');
@@ -57,8 +69,14 @@ function EmailSettings() {
         email,
         password,
       });
-      setMessage(response.data.message);
-      setMessageType('success');
+      const job = await waitForJob(response.data.job_id);
+      if (job.status === 'succeeded') {
+        setMessage(job.result?.message || 'Email settings are valid');
+        setMessageType('success');
+      } else {
+        setMessage(job.error || 'Email settings test failed');
+        setMessageType('error');
+      }
     } catch (error) {
       const errorMessage = error.response?.data?.error || error.message;
       setMessage(errorMessage);
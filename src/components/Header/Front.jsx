@@ -1086,13 +1086,7 @@ function FrontPage() {
     };
 
     try {
-      // Send order to kitchen
-      const kitchenResponse = await axios.post("http://localhost:5000/api/kitchen-saved", newOrder);
-      if (!kitchenResponse.data.success) {
-        throw new Error(kitchenResponse.data.error || "Failed to notify kitchen");
-      }
-      console.log("Order sent to kitchen:", kitchenResponse.data.order_id);
-
+      // Kitchens read active orders directly, so saving the order notifies them
       if (orderId) {
         // Verify if order exists before updating
         try {
@@ -64,8 +64,26 @@ function Kitchen() {
     }
   };
 
-  // Fetch active orders
+  // Fetch active orders, then follow changes over the kitchen event stream.
+  // Polling is only used when the server refuses the stream.
   useEffect(() => {
+    const normalizeOrder = (order) => ({
+      ...order,
+      cartItems: Array.isArray(order.cartItems)
+        ? order.cartItems.map((item) => ({
+            ...item,
+            kitchenStatuses: item.kitchenStatuses || {},
+          }))
+        : [],
+    });
+
+    const upsertOrder = (prev, order) => {
+      const normalized = normalizeOrder(order);
+      return prev.some((o) => o.orderId === normalized.orderId)
+        ? prev.map((o) => (o.orderId === normalized.orderId ? normalized : o))
+        : [...prev, normalized];
+    };
+
     const fetchOrders = async () => {
       try {
         setLoading(true);
@@ -73,16 +91,7 @@ function Kitchen() {
           axios.get(`${BASE_URL}/api/activeorders`, { timeout: 5000 })
         );
         if (Array.isArray(response.data)) {
-          const ordersWithStatuses = response.data.map((order) => ({
-            ...order,
-            cartItems: Array.isArray(order.cartItems)
-              ? order.cartItems.map((item) => ({
-                  ...item,
-                  kitchenStatuses: item.kitchenStatuses || {},
-                }))
-              : [],
-          }));
-          setSavedOrders(ordersWithStatuses);
+          setSavedOrders(response.data.map(normalizeOrder));
         } else {
           setSavedOrders([]);
           setErrorMessage("Invalid response from server");
@@ -97,9 +106,72 @@ function Kitchen() {
         setLoading(false);
       }
     };
-    fetchOrders();
-    const interval = setInterval(fetchOrders, 30000);
-    return () => clearInterval(interval);
+
+    let interval = null;
+    const startPolling = () => {
+      if (interval) return;
+      fetchOrders();
+      interval = setInterval(fetchOrders, 30000);
+    };
+
+    if (typeof EventSource === "undefined") {
+      startPolling();
+      return () => clearInterval(interval);
+    }
+
+    setLoading(true);
+    const source = new EventSource(`${BASE_URL}/api/stream/kitchens`);
+    const parse = (event) => JSON.parse(event.data);
+
+    source.addEventListener("snapshot", (event) => {
+      const { orders } = parse(event);
+      setSavedOrders(Array.isArray(orders) ? orders.map(normalizeOrder) : []);
+      setLoading(false);
+    });
+    source.addEventListener("order_created", (event) => {
+      const { order } = parse(event);
+      setSavedOrders((prev) => upsertOrder(prev, order));
+    });
+    source.addEventListener("order_updated", (event) => {
+      const { order } = parse(event);
+      if (order) setSavedOrders((prev) => upsertOrder(prev, order));
+    });
+    source.addEventListener("order_deleted", (event) => {
+      const { orderId } = parse(event);
+      setSavedOrders((prev) => prev.filter((o) => o.orderId !== orderId));
+    });
+    source.addEventListener("item_status", (event) => {
+      const { orderId, itemId, kitchen, status } = parse(event);
+      setSavedOrders((prev) =>
+        prev.map((o) =>
+          o.orderId !== orderId
+            ? o
+            : {
+                ...o,
+                cartItems: o.cartItems.map((item) =>
+                  item.id !== itemId
+                    ? item
+                    : { ...item, kitchenStatuses: { ...item.kitchenStatuses, [kitchen]: status } }
+                ),
+              }
+        )
+      );
+    });
+    // The server dropped events for this display; reload the full list.
+    source.addEventListener("resync", fetchOrders);
+    source.onerror = () => {
+      // EventSource reconnects on its own (and gets a fresh snapshot) unless the
+      // server refused the stream, e.g. with 503 when too many are open.
+      if (source.readyState === EventSource.CLOSED) {
+        console.warn("Kitchen stream unavailable, falling back to polling");
+        startPolling();
+      }
+    };
+
+    return () => {
+      source.close();
+      clearInterval(interval);
+    };
   }, []);
 
   // Fetch historical picked-up items
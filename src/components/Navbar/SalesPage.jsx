@@ -533,6 +533,19 @@ const SalesPage = () => {
     }
   };
 
+  // /api/send-email only queues the message; poll the job for the outcome.
+  // Returns null if it is still queued or retrying when we stop waiting.
+  const waitForEmailJob = async (jobId) => {
+    for (let attempt = 0; attempt < 30; attempt += 1) {
+      const { data } = await axios.get(`http://localhost:5000/api/jobs/${jobId}`);
+      if (data.status === "succeeded" || data.status === "failed") {
+        return data;
+      }
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+    return null;
+  };
+
   const handleEmail = async (sale) => {
     const htmlContent = generatePrintableContent(sale);
     const emailData = {
@@ -550,8 +563,20 @@ const SalesPage = () => {
         }
       );
       if (response.data.success) {
-        setWarningMessage("Invoice emailed successfully!");
-        setWarningType("success");
+        setWarningMessage("Sending invoice...");
+        setWarningType("info");
+        const job = await waitForEmailJob(response.data.job_id);
+        if (job?.status === "failed") {
+          setWarningMessage("Failed to send email: " + job.error);
+          setWarningType("warning");
+        } else {
+          setWarningMessage(
+            job
+              ? "Invoice emailed successfully!"
+              : "Invoice queued; it will be emailed in the background"
+          );
+          setWarningType("success");
+        }
       } else {
         setWarningMessage("Failed to send email: " + response.data.message);
         setWarningType("warning");
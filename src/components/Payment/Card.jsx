@@ -703,6 +703,19 @@ function Card() {
         }
     };
 
+    // /api/send-email only queues the message; poll the job for the outcome.
+    // Returns null if it is still queued or retrying when we stop waiting.
+    const waitForEmailJob = async (jobId) => {
+        for (let attempt = 0; attempt < 30; attempt += 1) {
+            const { data } = await axios.get(`http://127.0.0.1:5000/api/jobs/${jobId}`);
+            if (data.status === "succeeded" || data.status === "failed") {
+                return data;
+            }
+            await new Promise((resolve) => setTimeout(resolve, 1000));
+        }
+        return null;
+    };
+
     // Handle email functionality
     const handleEmail = async () => {
         if (!emailAddress || !emailAddress.includes("@")) {
@@ -724,15 +737,29 @@ function Card() {
                 headers: { "Content-Type": "application/json" },
                 timeout: 30000,
             });
-            setIsLoading(false);
             if (response.data.success) {
-                setWarningMessage("Receipt sent successfully to " + emailAddress);
+                setWarningMessage("Sending receipt to " + emailAddress + "...");
+                setWarningType("info");
+                const job = await waitForEmailJob(response.data.job_id);
+                setIsLoading(false);
+                if (job?.status === "failed") {
+                    setError("Failed to send email: " + job.error);
+                    setWarningMessage("Failed to send email: " + job.error);
+                    setWarningType("warning");
+                    return;
+                }
+                setWarningMessage(
+                    job
+                        ? "Receipt sent successfully to " + emailAddress
+                        : "Receipt queued for " + emailAddress + "; it will be sent in the background"
+                );
                 setWarningType("success");
                 setPendingAction(() => () => {
                     setShowModal(false);
                     navigate("/frontpage");
                 });
             } else {
+                setIsLoading(false);
                 setError("Failed to send email: " + response.data.message);
                 setWarningMessage("Failed to send email: " + response.data.message);
                 setWarningType("warning");
@@ -0,0 +1,26 @@
+"""Import app against an in-memory MongoDB so routes can be exercised without a server."""
+import importlib
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    mongomock = pytest.importorskip('mongomock')
+    os.environ.setdefault('UPLOAD_FOLDER', tempfile.mkdtemp())
+    patch = pytest.MonkeyPatch()
+    patch.setattr('pymongo.MongoClient', mongomock.MongoClient)
+    try:
+        return importlib.import_module('app')
+    finally:
+        patch.undo()
+
+
+@pytest.fixture(scope='session')
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,41 @@
+"""PATCH /api/activeorders/<id>/items rejects malformed cart diffs with 400."""
+import pytest
+
+
+@pytest.fixture(scope='module', autouse=True)
+def order(app_module):
+    app_module.activeorders_collection.insert_one({
+        'orderId': 'o1',
+        'cartItems': [{'id': 'a', 'quantity': 1, 'requiredKitchens': ['Main Kitchen']}]
+    })
+
+
+@pytest.mark.parametrize('body', [
+    ['not', 'an', 'object'],
+    {'add': 'x'},
+    {'add': ['x']},
+    {'add': [{'id': {'nested': 1}}]},
+    {'update': 'x'},
+    {'update': ['x']},
+    {'update': [{'quantity': 2}]},
+    {'update': [{'id': 'a', 'quantity': '3'}]},
+    {'update': [{'id': 'a', 'quantity': True}]},
+    {'remove': 'abc'},
+    {'remove': [{'id': 'a'}]},
+    {},
+])
+def test_malformed_diff_returns_400(client, body):
+    response = client.patch('/api/activeorders/o1/items', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_unknown_order_returns_404(client):
+    response = client.patch('/api/activeorders/missing/items', json={'remove': ['a']})
+    assert response.status_code == 404
+
+
+def test_unmatched_ids_are_reported(client):
+    response = client.patch('/api/activeorders/o1/items', json={'remove': ['zz']})
+    assert response.status_code == 200
+    assert response.get_json()['unmatchedItemIds'] == ['zz']
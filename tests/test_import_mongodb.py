@@ -0,0 +1,46 @@
+"""The real import skips the same conflicts the dry run reports."""
+import io
+import json
+
+import pytest
+
+
+@pytest.fixture
+def customers(app_module):
+    collection = app_module.db['customers']
+    collection.delete_many({})
+    collection.insert_many([
+        {'phone_number': '111', 'customer_name': 'First'},
+        {'phone_number': '111', 'customer_name': 'Second'},
+        {'phone_number': '222', 'customer_name': 'Third'},
+    ])
+    return collection
+
+
+def upload(client, records, dry_run=False):
+    data = {'file': (io.BytesIO(json.dumps(records).encode()), 'restaurant.customers.json')}
+    url = '/api/import-mongodb' + ('?dry_run=1' if dry_run else '')
+    return client.post(url, data=data, content_type='multipart/form-data').get_json()
+
+
+RECORDS = [
+    {'phone_number': '111', 'customer_name': 'Ambiguous'},
+    {'phone_number': '222', 'customer_name': 'Updated'},
+    {'phone_number': '222', 'customer_name': 'Repeated'},
+    {'phone_number': '333', 'customer_name': 'New'},
+]
+
+
+def test_dry_run_and_import_agree(client, customers):
+    preview = upload(client, RECORDS, dry_run=True)
+    result = upload(client, RECORDS)
+    assert (preview['inserts'], preview['updates'], preview['conflicted']) == (1, 1, 2)
+    assert (result['inserted'], result['updated'], result['conflicted']) == (1, 1, 2)
+    assert [c['index'] for c in result['conflicts']] == [c['index'] for c in preview['conflicts']] == [0, 2]
+
+
+def test_conflicting_records_are_not_written(client, customers):
+    upload(client, RECORDS)
+    names = sorted(doc['customer_name'] for doc in customers.find({'phone_number': '111'}))
+    assert names == ['First', 'Second']
+    assert customers.find_one({'phone_number': '222'})['customer_name'] == 'Updated'
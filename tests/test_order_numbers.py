@@ -0,0 +1,34 @@
+"""Order numbering survives a malformed reset time."""
+import pytest
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('06:30', (6, 30)),
+    ('0:00', (0, 0)),
+    ('23:59', (23, 59)),
+    ('6am', None),
+    ('', None),
+    ('24:00', None),
+    ('12:60', None),
+    (None, None),
+])
+def test_parse_reset_time(app_module, value, expected):
+    assert app_module.parse_reset_time(value) == expected
+
+
+def test_malformed_stored_reset_time_falls_back_to_midnight(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'get_system_settings',
+                        lambda: {'orderNumberReset': 'daily', 'orderNumberResetTime': '6am'})
+    monkeypatch.delenv('ORDER_NUMBER_RESET', raising=False)
+    monkeypatch.delenv('ORDER_NUMBER_RESET_TIME', raising=False)
+    assert app_module.order_number_period() == app_module.datetime.now().date().isoformat()
+
+
+@pytest.mark.parametrize('settings', [
+    {'orderNumberResetTime': '6am'},
+    {'orderNumberResetTime': ''},
+    {'orderNumberReset': 'weekly'},
+])
+def test_settings_reject_invalid_order_number_reset(client, settings):
+    response = client.post('/api/settings', json=settings)
+    assert response.status_code == 400
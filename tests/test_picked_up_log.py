@@ -0,0 +1,40 @@
+"""Concurrent first pick-ups share one bucket instead of each opening their own."""
+import pytest
+
+
+@pytest.fixture
+def picked_up(app_module):
+    collection = app_module.picked_up_collection
+    collection.delete_many({})
+    collection.create_index(
+        [('customerName', 1), ('tableNumber', 1), ('bucket', 1), ('seq', 1)],
+        unique=True, partialFilterExpression={'seq': {'$exists': True}}
+    )
+    return collection
+
+
+def test_full_bucket_opens_next_seq(app_module, picked_up, monkeypatch):
+    monkeypatch.setattr(app_module, 'PICKED_UP_BUCKET_SIZE', 2)
+    results = [app_module.append_picked_up_item('Ann', '1', 'Dine In', {'id': i}) for i in range(3)]
+    assert [created for _, created in results] == [True, False, True]
+    assert sorted(doc['seq'] for doc in picked_up.find()) == [0, 1]
+
+
+def test_racing_open_retries_into_existing_bucket(app_module, picked_up, monkeypatch):
+    real_insert_one = picked_up.insert_one
+    calls = []
+
+    def racing_insert_one(*args, **kwargs):
+        # Another writer opens seq 0 between this writer's lookup and its insert.
+        calls.append(1)
+        if len(calls) == 1:
+            app_module.append_picked_up_item('Ann', '1', 'Dine In', {'id': 'other'})
+        return real_insert_one(*args, **kwargs)
+
+    monkeypatch.setattr(picked_up, 'insert_one', racing_insert_one)
+    bucket_id, created = app_module.append_picked_up_item('Ann', '1', 'Dine In', {'id': 'mine'})
+
+    docs = list(picked_up.find())
+    assert len(docs) == 1
+    assert (bucket_id, created) == (docs[0]['_id'], False)
+    assert [i['id'] for i in docs[0]['items']] == ['other', 'mine']
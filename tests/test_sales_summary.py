@@ -0,0 +1,50 @@
+"""The daily summary rebuild keeps sales recorded while it runs."""
+import pytest
+
+
+def sale(invoice_no, date, total, user_id='u1'):
+    return {'invoice_no': invoice_no, 'date': date, 'userId': user_id, 'total': total,
+            'grand_total': total, 'status': 'Paid', 'items': [{'item_name': 'Tea', 'quantity': 1}]}
+
+
+@pytest.fixture
+def sales(app_module):
+    app_module.sales_collection.delete_many({})
+    app_module.sales_daily_summary_collection.delete_many({})
+    for record in (sale('S1', '2026-01-01', 10), sale('S2', '2026-01-01', 5), sale('S3', '2026-01-02', 7)):
+        app_module.sales_collection.insert_one(record)
+        app_module.record_sale_in_summary(record)
+    # A stale row with no sales behind it is removed by the rebuild.
+    app_module.sales_daily_summary_collection.insert_one(
+        {'date': '2025-12-31', 'pos_profile': 'POS-001', 'userId': 'u1', 'grand_total': 99, 'modified_at': 'x'})
+    return app_module
+
+
+def totals(app_module):
+    return {row['date']: (row['invoice_count'], row['grand_total'])
+            for row in app_module.sales_daily_summary_collection.find()}
+
+
+def test_rebuild_matches_sales(client, sales):
+    response = client.post('/api/sales-summary/rebuild')
+    assert response.status_code == 200
+    assert totals(sales) == {'2026-01-01': (2, 15.0), '2026-01-02': (1, 7.0)}
+
+
+def test_sale_recorded_during_rebuild_is_kept(client, sales, monkeypatch):
+    summarize = sales.summarize_sales
+    calls = []
+
+    def summarize_with_concurrent_sale(cursor):
+        result = summarize(cursor)
+        if not calls:
+            late = sale('S4', '2026-01-02', 3)
+            sales.sales_collection.insert_one(late)
+            sales.record_sale_in_summary(late)
+        calls.append(1)
+        return result
+
+    monkeypatch.setattr(sales, 'summarize_sales', summarize_with_concurrent_sale)
+    response = client.post('/api/sales-summary/rebuild')
+    assert response.status_code == 200
+    assert totals(sales) == {'2026-01-01': (2, 15.0), '2026-01-02': (2, 10.0)}